@@ -0,0 +1,176 @@
+"""
+Benchmark per-request sqlite3.connect vs the pooled WAL connections in db.py
+Runs the search and order-book queries from server.py against a synthetic database.
+Each request runs on a thread of its own, as under werkzeug's threaded server,
+so connection reuse cannot lean on long-lived threads.
+
+Usage: python benchmark_db.py [instrument_rows] [seconds_per_run]
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from db import ConnectionPool
+
+READER_THREADS = 8
+
+SEARCH_SQL = '''
+    SELECT * FROM instruments WHERE
+    (UPPER(trading_symbol) LIKE ? OR UPPER(display_name) LIKE ? OR
+     UPPER(symbol_name) LIKE ? OR UPPER(instrument_name) LIKE ? OR
+     UPPER(exchange) LIKE ? OR UPPER(segment) LIKE ?)
+    LIMIT 100
+'''
+ORDERS_SQL = 'SELECT * FROM orders WHERE user_token = ? ORDER BY created_at DESC LIMIT 100'
+INSERT_ORDER_SQL = '''
+    INSERT INTO orders (user_token, security_id, side, quantity, executed_price)
+    VALUES (?, ?, 'BUY', 1, 100.0)
+'''
+
+
+def build_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE instruments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, security_id TEXT UNIQUE NOT NULL,
+            exchange TEXT, segment TEXT, instrument_name TEXT, trading_symbol TEXT,
+            display_name TEXT, symbol_name TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE orders (
+            order_id INTEGER PRIMARY KEY AUTOINCREMENT, user_token TEXT NOT NULL,
+            security_id TEXT, side TEXT, quantity INTEGER, executed_price REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX idx_orders_user_token ON orders(user_token)')
+    rng = random.Random(7)
+    symbols = ['NIFTY', 'BANKNIFTY', 'RELIANCE', 'TCS', 'INFY', 'SBIN'] + [
+        ''.join(rng.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(6)) for _ in range(500)
+    ]
+    conn.executemany(
+        'INSERT INTO instruments (security_id, exchange, segment, instrument_name, '
+        'trading_symbol, display_name, symbol_name) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            (str(i), 'NSE', 'D', 'OPTIDX', f'{s}-{i % 90000}-CE', f'{s} {i % 90000} CE', s)
+            for i, s in ((i, rng.choice(symbols)) for i in range(rows))
+        )
+    )
+    conn.executemany(
+        INSERT_ORDER_SQL,
+        ((f'user_{i % 200}', str(i)) for i in range(20000))
+    )
+    conn.commit()
+    conn.close()
+
+
+def per_request_thread(handle):
+    """Serve one request on a fresh thread, as werkzeug's threaded server does"""
+    thread = threading.Thread(target=handle)
+    thread.start()
+    thread.join()
+
+
+def run(label, workload, get_conn, put_conn, seconds):
+    """Hammer one endpoint's query from reader threads while a writer places orders"""
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'busy': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def reader(worker):
+        rng = random.Random(worker)
+        local = {'reads': 0, 'busy': 0}
+        local_latencies = []
+
+        def handle():
+            conn = get_conn()
+            try:
+                if workload == 'search':
+                    pattern = f'%{rng.choice(["NIFTY", "BANKNIFTY", "RELI", "INFY"])}%'
+                    conn.execute(SEARCH_SQL, [pattern] * 6).fetchall()
+                else:
+                    conn.execute(ORDERS_SQL, (f'user_{rng.randrange(200)}',)).fetchall()
+                local['reads'] += 1
+            except sqlite3.OperationalError:
+                local['busy'] += 1
+            finally:
+                put_conn(conn)
+
+        while not stop.is_set():
+            started = time.perf_counter()
+            per_request_thread(handle)
+            local_latencies.append(time.perf_counter() - started)
+        with lock:
+            counts['reads'] += local['reads']
+            counts['busy'] += local['busy']
+            latencies.extend(local_latencies)
+
+    def place_order():
+        conn = get_conn()
+        try:
+            conn.execute(INSERT_ORDER_SQL, ('user_0', 'bench'))
+            conn.commit()
+            counts['writes'] += 1
+        except sqlite3.OperationalError:
+            counts['busy'] += 1
+        finally:
+            put_conn(conn)
+
+    def writer():
+        while not stop.is_set():
+            per_request_thread(place_order)
+            time.sleep(0.002)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(READER_THREADS)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(
+        f"{label:<24} {workload:<7} {counts['reads'] / seconds:8.0f} req/s  "
+        f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+        f"writes {counts['writes'] / seconds:5.0f}/s  busy errors {counts['busy']}"
+    )
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        after_path = os.path.join(tmp, 'after.db')
+        print(f"Building {rows} instruments...")
+        build_database(before_path, rows)
+        with open(before_path, 'rb') as src, open(after_path, 'wb') as dst:
+            dst.write(src.read())
+
+        # Before: the old get_db(), a fresh rollback-journal connection per request
+        def connect_per_request():
+            conn = sqlite3.connect(before_path)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        pool = ConnectionPool(after_path)
+        for workload in ('search', 'orders'):
+            run('connect per request', workload, connect_per_request, lambda conn: conn.close(), seconds)
+            run('pooled WAL connections', workload, pool.acquire, lambda conn: conn.close(), seconds)
+        print(f"Pool opened {pool.created} connections in total")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark the old per-field ticker parsing vs the precompiled-struct frame decoder
+Decodes synthetic DhanHQ frames and reports packets per second
+
+Usage: python benchmark_feed.py [packets] [packets_per_frame]
+"""
+
+import random
+import struct
+import sys
+import time
+
+from feed_decoder import (
+    decode_frame, PACKETS, FULL_STRUCT, DEPTH, DEPTH_LEVELS, FULL_SIZE,
+    TICKER, QUOTE, PREV_CLOSE, FULL
+)
+
+
+def build_packets(count, rng):
+    packets = []
+    for _ in range(count):
+        segment = rng.choice((1, 2))
+        security_id = rng.randrange(1, 100000)
+        ltp = rng.uniform(10, 5000)
+        kind = rng.random()
+        if kind < 0.85:
+            packet_struct = PACKETS[TICKER][0]
+            packets.append(packet_struct.pack(TICKER, packet_struct.size, segment, security_id, ltp, 1700000000))
+        elif kind < 0.95:
+            packet_struct = PACKETS[QUOTE][0]
+            packets.append(packet_struct.pack(QUOTE, packet_struct.size, segment, security_id, ltp, 10,
+                                              1700000000, ltp, 5000, 100, 200, ltp, ltp, ltp, ltp))
+        elif kind < 0.98:
+            packet_struct = PACKETS[PREV_CLOSE][0]
+            packets.append(packet_struct.pack(PREV_CLOSE, packet_struct.size, segment, security_id, ltp, 0))
+        else:
+            depth = b''.join(DEPTH.pack(10, 20, 1, 2, ltp - 0.05, ltp + 0.05) for _ in range(DEPTH_LEVELS))
+            packets.append(FULL_STRUCT.pack(FULL, FULL_SIZE, segment, security_id, ltp, 10, 1700000000, ltp,
+                                            5000, 100, 200, 0, 0, 0, ltp, ltp, ltp, ltp) + depth)
+    return packets
+
+
+def legacy_decode(data):
+    """The old process_ticker_data parsing: first packet only, one unpack per field
+
+    The old 17-byte minimum is relaxed to 16 so real ticker packets are decoded.
+    """
+    if len(data) < 16:
+        return None
+    response_code = struct.unpack('B', data[0:1])[0]
+    message_length = struct.unpack('<H', data[1:3])[0]
+    exchange_segment = struct.unpack('B', data[3:4])[0]
+    security_id = struct.unpack('<I', data[4:8])[0]
+    ltp = struct.unpack('<f', data[8:12])[0]
+    ltt = struct.unpack('<I', data[12:16])[0]
+    return response_code, message_length, exchange_segment, security_id, ltp, ltt
+
+
+def run(label, decode, frames, packet_total):
+    start = time.perf_counter()
+    decoded = 0
+    for frame in frames:
+        result = decode(frame)
+        if result is not None:
+            decoded += len(result) if isinstance(result, list) else 1
+    elapsed = time.perf_counter() - start
+    # Rates count decoded packets; the legacy parser drops all but a frame's first
+    print(
+        f"{label:<36} {decoded / elapsed:12.0f} decoded packets/s  "
+        f"{elapsed / decoded * 1e6:6.2f} us/packet  decoded {decoded}/{packet_total}"
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    per_frame = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    rng = random.Random(7)
+    packets = build_packets(count, rng)
+
+    single = packets
+    batched = [b''.join(packets[i:i + per_frame]) for i in range(0, count, per_frame)]
+
+    print(f"{count} packets (85% ticker, 10% quote, 3% prev close, 2% full)")
+    run('legacy, one packet per frame', legacy_decode, single, count)
+    run('decoder, one packet per frame', decode_frame, single, count)
+    run('legacy, %d packets per frame' % per_frame, legacy_decode, batched, count)
+    run('decoder, %d packets per frame' % per_frame, decode_frame, batched, count)
+
+
+if __name__ == '__main__':
+    main()
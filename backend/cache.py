@@ -0,0 +1,108 @@
+"""
+Bounded in-memory caches with LRU eviction and per-entry TTL
+All operations are O(1); StripedLRUCache spreads keys over independently locked shards
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache whose entries also expire after `ttl` seconds
+
+    Recency lives in an OrderedDict, so get, put, eviction of the least
+    recently used entry and lazy expiry on read are all O(1).
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (value, stored_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, stored_at = entry
+            if time.monotonic() - stored_at >= self.ttl:
+                del self.entries[key]
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class StripedLRUCache:
+    """LRU/TTL cache split into `stripes` shards, each with its own lock
+
+    Threads touching different keys rarely contend on the same lock, which
+    matters for hot paths like /api/market/ltp where every request thread
+    reads dozens of keys. Capacity is divided evenly between the shards.
+    """
+
+    def __init__(self, max_size: int, ttl: float, stripes: int = 16):
+        per_stripe = max(1, -(-max_size // stripes))
+        self.shards = [LRUCache(per_stripe, ttl) for _ in range(stripes)]
+        self.max_size = per_stripe * stripes
+        self.ttl = ttl
+
+    def _shard(self, key) -> LRUCache:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def get(self, key, default=None):
+        return self._shard(key).get(key, default)
+
+    def put(self, key, value):
+        self._shard(key).put(key, value)
+
+    def clear(self):
+        for shard in self.shards:
+            shard.clear()
+
+    def stats(self) -> dict:
+        totals = {'size': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        for shard in self.shards:
+            shard_stats = shard.stats()
+            for key in totals:
+                totals[key] += shard_stats[key]
+        lookups = totals['hits'] + totals['misses']
+        totals.update({
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'stripes': len(self.shards),
+            'hit_rate': round(totals['hits'] / lookups, 4) if lookups else 0.0
+        })
+        return totals
@@ -0,0 +1,28 @@
+"""
+Compact binary frame format for price WebSocket clients
+Opt-in alternative to JSON ticker messages, negotiated with {"type": "format", "format": "binary"}
+"""
+
+import struct
+
+# Client message formats
+FORMATS = ('json', 'binary')
+
+# A binary frame is one or more fixed-size little-endian records:
+#   u8  record type (RECORD_TICK)
+#   u8  exchange segment code (DhanHQ numbering, see EXCHANGE_SEGMENT_CODES)
+#   u32 security id
+#   f32 last traded price
+#   u32 last traded time
+#   f32 change vs previous close (NaN until a prev-close packet arrives)
+#   f32 change percent (NaN likewise)
+# Status, subscription and other control messages stay JSON text frames.
+RECORD_TICK = 1
+TICK_RECORD = struct.Struct('<BBIfIff')
+
+NAN = float('nan')
+
+
+def encode_tick(segment: int, security_id: int, ltp: float, ltt: int,
+                change: float = NAN, change_percent: float = NAN) -> bytes:
+    return TICK_RECORD.pack(RECORD_TICK, segment, security_id, ltp, ltt, change, change_percent)
@@ -0,0 +1,223 @@
+"""
+Per-client outbound queues for the price WebSocket server
+Fan-out only enqueues; a writer task per client does the socket sends
+"""
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Union
+import logging
+
+import websockets
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# What to do when a client's queue is full
+SLOW_CLIENT_POLICIES = ('drop_oldest', 'conflate', 'disconnect')
+
+# JSON micro-batches: {"type":"batch","updates":[<tick>,<tick>,...]}
+BATCH_PREFIX = '{"type":"batch","updates":['
+BATCH_SUFFIX = ']}'
+
+
+class ClientSession:
+    """A connected client's bounded send queue and the task draining it
+
+    Messages wait in one insertion-ordered dict. Under the 'conflate'
+    policy a tick replaces the queued, still unsent tick for the same
+    instrument in place, so a lagging client gets the latest price without
+    losing its place in line. When the queue is full, 'drop_oldest' and
+    'conflate' discard the oldest message, and 'disconnect' closes the
+    socket so the client can reconnect and resubscribe.
+
+    A client may also cap updates per instrument (`max_rate` per second).
+    Ticks arriving sooner than 1 / max_rate after the instrument's last
+    send are held, newest replacing older, and the held value goes out once
+    the interval is up, so bursts cost a bounded number of messages.
+
+    With a batch window the writer waits that long after the first queued
+    message and then packs consecutive ticks into one frame of at most
+    `max_frame_bytes`: JSON ticks as {"type": "batch", "updates": [...]},
+    built by joining the already-encoded messages, and binary records
+    simply concatenated. Control messages are still sent on their own, in
+    order.
+    """
+
+    def __init__(self, websocket: websockets.WebSocketServerProtocol, max_queue: int = 1000,
+                 policy: str = 'drop_oldest', max_frame_bytes: int = 64 * 1024):
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.policy = policy
+        self.binary = False  # compact binary tick records instead of JSON, see client_protocol
+        self.pending: 'OrderedDict[Hashable, tuple]' = OrderedDict()  # slot -> (message, key)
+        self.sequence = itertools.count()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+        self.disconnect_reason = None
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.max_depth = 0
+        self.min_interval = 0.0  # seconds between updates per instrument; 0 is uncapped
+        self.last_sent: Dict[Hashable, float] = {}
+        self.held: Dict[Hashable, Union[str, bytes]] = {}
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.rate_limited = 0
+        self.batch_window = 0.0  # seconds; 0 sends every message as its own frame
+        self.max_frame_bytes = max_frame_bytes
+        self.frames = 0
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def enqueue(self, message: Union[str, bytes], key: Optional[Hashable] = None) -> bool:
+        """Queue `message` without blocking; `key` marks ticks that may be conflated
+
+        str goes out as a text frame and bytes as a binary frame.
+        """
+        if self.closing:
+            return False
+        if key is not None and self.min_interval:
+            now = time.monotonic()
+            due = self.last_sent.get(key, 0.0) + self.min_interval
+            if now < due:
+                if key in self.held:
+                    self.rate_limited += 1
+                self.held[key] = message
+                if self.flush_handle is None:
+                    self.flush_handle = asyncio.get_running_loop().call_later(due - now, self.flush_held)
+                return True
+            self.last_sent[key] = now
+        return self._push(message, key)
+
+    def set_max_rate(self, max_rate: Optional[float]):
+        """Cap updates per instrument per second; None or 0 removes the cap"""
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        if not self.min_interval:
+            self.flush_held()
+
+    def flush_held(self):
+        """Send held ticks whose interval is up; re-arm for the rest"""
+        self.flush_handle = None
+        now = time.monotonic()
+        next_due = None
+        for key in list(self.held):
+            due = self.last_sent.get(key, 0.0) + self.min_interval
+            if due <= now or not self.min_interval:
+                self.last_sent[key] = now
+                self._push(self.held.pop(key), key)
+            elif next_due is None or due < next_due:
+                next_due = due
+        if next_due is not None and not self.closing:
+            self.flush_handle = asyncio.get_running_loop().call_later(next_due - now, self.flush_held)
+
+    def forget(self, key: Hashable):
+        """Drop rate-cap state for an instrument the client no longer follows"""
+        self.last_sent.pop(key, None)
+        self.held.pop(key, None)
+
+    def _push(self, message: Union[str, bytes], key: Optional[Hashable]) -> bool:
+        if self.closing:
+            return False
+        if key is not None and self.policy == 'conflate':
+            slot = ('tick', key)
+            if slot in self.pending:
+                self.pending[slot] = (message, key)
+                self.conflated += 1
+                return True
+        else:
+            slot = next(self.sequence)
+        if len(self.pending) >= self.max_queue:
+            if self.policy == 'disconnect':
+                self.disconnect('slow consumer')
+                return False
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[slot] = (message, key)
+        self.max_depth = max(self.max_depth, len(self.pending))
+        self.ready.set()
+        return True
+
+    async def run(self):
+        try:
+            while True:
+                await self.ready.wait()
+                if self.batch_window:
+                    await asyncio.sleep(self.batch_window)
+                while self.pending:
+                    await self.websocket.send(self._next_frame())
+                    self.frames += 1
+                self.ready.clear()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"[Client] Send failed: {e}")
+            self.disconnect('send error')
+
+    def _next_frame(self) -> Union[str, bytes]:
+        """Pop the next message, plus the ticks that can share its frame when batching"""
+        _, (message, key) = self.pending.popitem(last=False)
+        self.sent += 1
+        if not self.batch_window or key is None:
+            return message
+        binary = isinstance(message, bytes)
+        parts = [message]
+        # A JSON batch pays for its wrapper as soon as a second update joins
+        size = len(message) if binary else len(message) + len(BATCH_PREFIX) + len(BATCH_SUFFIX)
+        while self.pending:
+            slot = next(iter(self.pending))
+            next_message, next_key = self.pending[slot]
+            if next_key is None or isinstance(next_message, bytes) != binary:
+                break
+            if size + len(next_message) + 1 > self.max_frame_bytes:
+                break
+            del self.pending[slot]
+            parts.append(next_message)
+            size += len(next_message) + 1
+            self.sent += 1
+        if binary:
+            return b''.join(parts)
+        if len(parts) == 1:
+            return message
+        return BATCH_PREFIX + ','.join(parts) + BATCH_SUFFIX
+
+    def set_batch_window(self, seconds: float):
+        self.batch_window = max(0.0, seconds)
+
+    def disconnect(self, reason: str):
+        if self.closing:
+            return
+        self.closing = True
+        self.disconnect_reason = reason
+        self.pending.clear()
+        self.held.clear()
+        logger.warning(f"[Client] Disconnecting client: {reason}")
+        # The client's handler sees the close and removes the session
+        asyncio.create_task(self.websocket.close(code=1008, reason=reason))
+
+    def stop(self):
+        self.closing = True
+        self.pending.clear()
+        self.held.clear()
+        if self.flush_handle:
+            self.flush_handle.cancel()
+        if self.task:
+            self.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': len(self.pending),
+            'max_depth': self.max_depth,
+            'sent': self.sent,
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'conflated': self.conflated,
+            'rate_limited': self.rate_limited,
+            'held': len(self.held)
+        }
@@ -0,0 +1,215 @@
+"""
+Local pub/sub between the feed-ingest process and WebSocket fan-out workers
+The ingest process owns the DhanHQ connections; workers accept clients and fan ticks out
+"""
+
+import asyncio
+import json
+import os
+import struct
+import tempfile
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+InstrumentKey = Tuple[int, int]  # (numeric exchange segment, security_id)
+
+DEFAULT_SOCKET_PATH = os.path.join(tempfile.gettempdir(), 'dhanhq-fanout.sock')
+
+# Messages on the Unix socket: u8 type, u32 payload length, payload
+MESSAGE_HEADER = struct.Struct('<BI')
+FEED_BINARY = 1   # ingest -> worker: a raw DhanHQ binary frame
+FEED_TEXT = 2     # ingest -> worker: a DhanHQ status message, utf-8
+SUBSCRIBE = 3     # worker -> ingest: JSON [[segment, security_id], ...]
+UNSUBSCRIBE = 4   # worker -> ingest: same payload
+
+# A worker this far behind on the socket starts losing frames
+MAX_WORKER_BUFFER = 16 * 1024 * 1024
+
+
+def _encode(message_type: int, payload: bytes) -> bytes:
+    return MESSAGE_HEADER.pack(message_type, len(payload)) + payload
+
+
+async def _read_message(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    message_type, length = MESSAGE_HEADER.unpack(await reader.readexactly(MESSAGE_HEADER.size))
+    return message_type, await reader.readexactly(length)
+
+
+def _encode_keys(message_type: int, keys: Iterable[InstrumentKey]) -> bytes:
+    return _encode(message_type, json.dumps([list(key) for key in keys]).encode())
+
+
+class _Worker:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.keys: Set[InstrumentKey] = set()
+        self.dropped = 0
+
+
+class IngestPublisher:
+    """Ingest side: publishes every feed frame to the connected workers
+
+    Workers send the instruments their clients want; the union, reference
+    counted per worker, is what the ingest manager keeps subscribed
+    upstream. Frames are written without awaiting the socket, so a stalled
+    worker costs buffered bytes and then dropped frames, never a stalled
+    feed.
+    """
+
+    def __init__(self, subscribe: Callable, unsubscribe: Callable, path: str = DEFAULT_SOCKET_PATH):
+        self.subscribe = subscribe      # async (keys) -> None, e.g. manager.subscribe_to_instruments
+        self.unsubscribe = unsubscribe  # async (keys) -> None
+        self.path = path
+        self.workers: List[_Worker] = []
+        self.interest: Dict[InstrumentKey, Set[_Worker]] = {}
+        self.server = None
+        self.published = 0
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, path=self.path)
+        logger.info(f"[Fanout] Publishing feed on {self.path}")
+
+    def publish(self, message):
+        """Called by the ingest manager's dispatch stage with each raw frame"""
+        if not self.workers:
+            return
+        if isinstance(message, bytes):
+            data = _encode(FEED_BINARY, message)
+        else:
+            data = _encode(FEED_TEXT, message.encode())
+        self.published += 1
+        for worker in self.workers:
+            if worker.writer.transport.get_write_buffer_size() > MAX_WORKER_BUFFER:
+                worker.dropped += 1
+                continue
+            worker.writer.write(data)
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = _Worker(writer)
+        self.workers.append(worker)
+        logger.info(f"[Fanout] Worker connected. Total: {len(self.workers)}")
+        try:
+            while True:
+                message_type, payload = await _read_message(reader)
+                keys = [tuple(key) for key in json.loads(payload)]
+                if message_type == SUBSCRIBE:
+                    await self.add_interest(worker, keys)
+                elif message_type == UNSUBSCRIBE:
+                    await self.release_interest(worker, keys)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"[Fanout] Worker message error: {e}")
+        finally:
+            self.workers.remove(worker)
+            await self.release_interest(worker, list(worker.keys))
+            writer.close()
+            logger.info(f"[Fanout] Worker disconnected. Total: {len(self.workers)}")
+
+    async def add_interest(self, worker: _Worker, keys: List[InstrumentKey]):
+        new_keys = []
+        for key in keys:
+            workers = self.interest.setdefault(key, set())
+            if not workers:
+                new_keys.append(key)
+            workers.add(worker)
+            worker.keys.add(key)
+        if new_keys:
+            await self.subscribe(sorted(new_keys))
+
+    async def release_interest(self, worker: _Worker, keys: List[InstrumentKey]):
+        orphaned = []
+        for key in keys:
+            worker.keys.discard(key)
+            workers = self.interest.get(key)
+            if workers is None:
+                continue
+            workers.discard(worker)
+            if not workers:
+                del self.interest[key]
+                orphaned.append(key)
+        if orphaned:
+            await self.unsubscribe(sorted(orphaned))
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self.workers),
+            'published': self.published,
+            'instruments': len(self.interest),
+            'worker_buffers': [worker.writer.transport.get_write_buffer_size() for worker in self.workers],
+            'worker_drops': [worker.dropped for worker in self.workers]
+        }
+
+
+class IngestSubscriber:
+    """Worker side: stands in for the DhanHQ connections of a fan-out worker's manager
+
+    Frames from the ingest process go into the manager's dispatch queue
+    exactly as a FeedConnection's would. On every (re)connect the worker's
+    full instrument set is sent again, so an ingest restart loses nothing.
+    """
+
+    def __init__(self, frames: asyncio.Queue, current_keys: Callable[[], Iterable[InstrumentKey]],
+                 path: str = DEFAULT_SOCKET_PATH):
+        self.frames = frames
+        self.current_keys = current_keys
+        self.path = path
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connected = False
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while self.running:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+            except OSError as e:
+                logger.warning(f"[Fanout] Ingest process not reachable ({e}), retrying")
+                await asyncio.sleep(1)
+                continue
+            self.connected = True
+            logger.info("[Fanout] Connected to ingest process")
+            keys = sorted(self.current_keys())
+            if keys:
+                self.writer.write(_encode_keys(SUBSCRIBE, keys))
+            try:
+                while True:
+                    message_type, payload = await _read_message(reader)
+                    if message_type == FEED_BINARY:
+                        await self.frames.put(payload)
+                    elif message_type == FEED_TEXT:
+                        await self.frames.put(payload.decode())
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.error("[Fanout] Lost ingest process, reconnecting")
+            finally:
+                self.connected = False
+                self.writer.close()
+                self.writer = None
+            await asyncio.sleep(1)
+
+    async def subscribe(self, keys: List[InstrumentKey]):
+        if self.writer:
+            self.writer.write(_encode_keys(SUBSCRIBE, keys))
+
+    async def unsubscribe(self, keys: List[InstrumentKey]):
+        if self.writer:
+            self.writer.write(_encode_keys(UNSUBSCRIBE, keys))
+
+    async def close(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    def stats(self) -> dict:
+        return {'ingest_connected': self.connected}
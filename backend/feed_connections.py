@@ -0,0 +1,191 @@
+"""
+Upstream DhanHQ feed connections for the WebSocket manager
+Each socket has its own receive task; instruments are spread over sockets by consistent hashing
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import logging
+
+import websockets
+
+from last_value_table import EXCHANGE_SEGMENT_NAMES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+InstrumentKey = Tuple[int, int]  # (numeric exchange segment, security_id)
+
+# DhanHQ feed request codes and limits
+REQUEST_SUBSCRIBE_TICKER = 15
+REQUEST_UNSUBSCRIBE_TICKER = 16
+MAX_INSTRUMENTS_PER_REQUEST = 100
+MAX_INSTRUMENTS_PER_CONNECTION = 5000
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class ConsistentHashRing:
+    """Maps instruments to nodes so that adding or removing a node moves ~1/n of them"""
+
+    def __init__(self, nodes: Iterable[Hashable] = (), replicas: int = 64):
+        self.replicas = replicas
+        self.points: List[int] = []
+        self.owners: Dict[int, Hashable] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: Hashable):
+        for replica in range(self.replicas):
+            point = _hash(f'{node}#{replica}')
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+                self.owners[point] = node
+
+    def remove(self, node: Hashable):
+        self.points = [point for point in self.points if self.owners[point] != node]
+        self.owners = {point: self.owners[point] for point in self.points}
+
+    def node_for(self, key: InstrumentKey) -> Optional[Hashable]:
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, _hash(f'{key[0]}:{key[1]}')) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+class FeedConnection:
+    """One upstream DhanHQ socket and the instruments assigned to it
+
+    The receive task only hands raw frames to the shared dispatch queue;
+    decoding and fan-out happen in the manager's single dispatch stage.
+    On connect and on drop it reports to `on_state_change` so the manager
+    can rebalance instruments across the live connections.
+    """
+
+    def __init__(self, index: int, url: str, frames: asyncio.Queue,
+                 on_state_change: Callable[['FeedConnection'], Awaitable[None]],
+                 max_reconnect_attempts: int = 50):
+        self.index = index
+        self.url = url
+        self.frames = frames
+        self.on_state_change = on_state_change
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.reconnect_attempts = 0
+        self.ws = None
+        self.connected = False
+        self.running = False
+        self.instruments: Set[InstrumentKey] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.frames_received = 0
+
+    def __repr__(self):
+        return f'FeedConnection({self.index})'
+
+    async def connect(self) -> bool:
+        try:
+            logger.info(f"[DhanHQ:{self.index}] Connecting to DhanHQ WebSocket...")
+            self.ws = await websockets.connect(self.url)
+            self.connected = True
+            self.reconnect_attempts = 0
+            logger.info(f"[DhanHQ:{self.index}] Connected successfully!")
+            return True
+        except Exception as e:
+            logger.error(f"[DhanHQ:{self.index}] Connection failed: {e}")
+            return False
+
+    def start(self):
+        self.running = True
+        self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """Connect, receive until the socket drops, back off, repeat"""
+        while self.running:
+            if await self.connect():
+                # Whatever is still assigned here was never moved away; resubscribe it
+                if self.instruments:
+                    await self.send_instrument_requests(REQUEST_SUBSCRIBE_TICKER, sorted(self.instruments))
+                await self.on_state_change(self)
+                await self.receive()
+                self.connected = False
+                self.ws = None
+                if not self.running:
+                    break
+                await self.on_state_change(self)
+            if self.reconnect_attempts >= self.max_reconnect_attempts:
+                logger.error(f"[DhanHQ:{self.index}] Max reconnection attempts reached")
+                break
+            self.reconnect_attempts += 1
+            wait_time = min(5 * self.reconnect_attempts, 60)
+            logger.info(f"[DhanHQ:{self.index}] Reconnecting in {wait_time}s (attempt {self.reconnect_attempts})")
+            await asyncio.sleep(wait_time)
+
+    async def receive(self):
+        try:
+            while self.running:
+                try:
+                    message = await asyncio.wait_for(self.ws.recv(), timeout=60)
+                except asyncio.TimeoutError:
+                    logger.warning(f"[DhanHQ:{self.index}] No message received for 60s, connection may be stale")
+                    continue
+                self.frames_received += 1
+                await self.frames.put(message)
+        except websockets.exceptions.ConnectionClosed:
+            logger.error(f"[DhanHQ:{self.index}] Connection closed by server")
+        except Exception as e:
+            logger.error(f"[DhanHQ:{self.index}] Message handling error: {e}")
+
+    async def send_instrument_requests(self, request_code: int, keys: List[InstrumentKey]) -> bool:
+        """Send a subscribe/unsubscribe for `keys`, split at DhanHQ's per-message cap"""
+        if not self.connected:
+            return False
+        try:
+            for start in range(0, len(keys), MAX_INSTRUMENTS_PER_REQUEST):
+                chunk = keys[start:start + MAX_INSTRUMENTS_PER_REQUEST]
+                request = {
+                    "RequestCode": request_code,
+                    "InstrumentCount": len(chunk),
+                    "InstrumentList": [
+                        {'ExchangeSegment': EXCHANGE_SEGMENT_NAMES[segment], 'SecurityId': security_id}
+                        for segment, security_id in chunk
+                    ]
+                }
+                logger.debug(f"[DhanHQ:{self.index}] Instrument request: {request}")
+                await self.ws.send(json.dumps(request))
+            return True
+        except Exception as e:
+            logger.error(f"[DhanHQ:{self.index}] Request {request_code} failed: {e}")
+            return False
+
+    async def subscribe(self, keys: List[InstrumentKey]):
+        """Assign `keys` here; sent now if connected, otherwise on the next connect"""
+        self.instruments.update(keys)
+        if len(self.instruments) > MAX_INSTRUMENTS_PER_CONNECTION:
+            logger.warning(f"[DhanHQ:{self.index}] {len(self.instruments)} instruments exceed "
+                           f"the {MAX_INSTRUMENTS_PER_CONNECTION} per-connection limit")
+        await self.send_instrument_requests(REQUEST_SUBSCRIBE_TICKER, keys)
+
+    async def unsubscribe(self, keys: List[InstrumentKey]):
+        self.instruments.difference_update(keys)
+        await self.send_instrument_requests(REQUEST_UNSUBSCRIBE_TICKER, keys)
+
+    async def close(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+        if self.ws:
+            await self.ws.close()
+        self.connected = False
+
+    def stats(self) -> dict:
+        return {
+            'index': self.index,
+            'connected': self.connected,
+            'instruments': len(self.instruments),
+            'frames_received': self.frames_received,
+            'reconnect_attempts': self.reconnect_attempts
+        }
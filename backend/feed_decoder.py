@@ -0,0 +1,100 @@
+"""
+Decoder for DhanHQ v2 binary market feed frames
+Walks every packet in a WebSocket frame using precompiled little-endian structs
+"""
+
+import struct
+from collections import namedtuple
+from typing import List
+
+# Feed response codes (first header byte)
+TICKER = 2
+QUOTE = 4
+OI = 5
+PREV_CLOSE = 6
+MARKET_STATUS = 7
+FULL = 8
+DISCONNECT = 50
+
+# code, message length, exchange segment, security id
+HEADER = struct.Struct('<BHBI')
+
+TickerPacket = namedtuple('TickerPacket', 'code length segment security_id ltp ltt')
+QuotePacket = namedtuple('QuotePacket', 'code length segment security_id ltp ltq ltt atp volume '
+                                        'total_sell_qty total_buy_qty open close high low')
+OIPacket = namedtuple('OIPacket', 'code length segment security_id oi')
+PrevClosePacket = namedtuple('PrevClosePacket', 'code length segment security_id prev_close prev_oi')
+MarketStatusPacket = namedtuple('MarketStatusPacket', 'code length segment security_id')
+FullPacket = namedtuple('FullPacket', 'code length segment security_id ltp ltq ltt atp volume '
+                                      'total_sell_qty total_buy_qty oi oi_high oi_low '
+                                      'open close high low depth')
+DisconnectPacket = namedtuple('DisconnectPacket', 'code length segment security_id reason')
+DepthLevel = namedtuple('DepthLevel', 'bid_qty ask_qty bid_orders ask_orders bid_price ask_price')
+
+# One struct per packet type, header included, so a packet is a single unpack_from
+PACKETS = {
+    TICKER: (struct.Struct('<BHBIfI'), TickerPacket),
+    QUOTE: (struct.Struct('<BHBIfhIfIIIffff'), QuotePacket),
+    OI: (struct.Struct('<BHBII'), OIPacket),
+    PREV_CLOSE: (struct.Struct('<BHBIfI'), PrevClosePacket),
+    MARKET_STATUS: (HEADER, MarketStatusPacket),
+    DISCONNECT: (struct.Struct('<BHBIh'), DisconnectPacket),
+}
+FULL_STRUCT = struct.Struct('<BHBIfhIfIIIIIIffff')
+DEPTH = struct.Struct('<IIhhff')
+DEPTH_LEVELS = 5
+FULL_SIZE = FULL_STRUCT.size + DEPTH_LEVELS * DEPTH.size
+
+# code, message length: all the walk needs before picking a packet struct
+PREFIX = struct.Struct('<BH')
+
+# code -> (packet size, bound unpack_from, namedtuple constructor)
+_DECODERS = {
+    code: (packet_struct.size, packet_struct.unpack_from, packet_type._make)
+    for code, (packet_struct, packet_type) in PACKETS.items()
+}
+_DECODERS[FULL] = (FULL_SIZE, None, None)
+PACKET_SIZES = {code: decoder[0] for code, decoder in _DECODERS.items()}
+
+
+def _decode_full(frame, offset: int) -> FullPacket:
+    values = FULL_STRUCT.unpack_from(frame, offset)
+    offset += FULL_STRUCT.size
+    depth = [DepthLevel._make(DEPTH.unpack_from(frame, offset + i * DEPTH.size))
+             for i in range(DEPTH_LEVELS)]
+    return FullPacket(*values, depth)
+
+
+def decode_frame(frame: bytes) -> List[tuple]:
+    """All packets in one binary WebSocket frame, in order
+
+    Packets are stepped over by the header's message length, falling back
+    to the documented size when the length is missing or shorter than the
+    packet type needs. Unknown codes are skipped when their length allows
+    it; a truncated trailing packet ends the walk. Structs read straight
+    from the frame at an offset, so no packet bytes are sliced or copied.
+    """
+    end = len(frame)
+    offset = 0
+    packets = []
+    append = packets.append
+    header_size = HEADER.size
+    read_prefix = PREFIX.unpack_from
+    decoders = _DECODERS
+    while offset + header_size <= end:
+        code, length = read_prefix(frame, offset)
+        decoder = decoders.get(code)
+        if decoder is None:
+            if length < header_size:
+                break
+            offset += length
+            continue
+        size, unpack_from, make = decoder
+        if offset + size > end:
+            break
+        if unpack_from is None:
+            append(_decode_full(frame, offset))
+        else:
+            append(make(unpack_from(frame, offset)))
+        offset += length if length >= size else size
+    return packets
@@ -0,0 +1,107 @@
+"""
+Background instrument-master import jobs
+Runs uploads on a worker pool and tracks their progress for the jobs endpoint
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ImportJob:
+    """Progress of one upload, updated by the worker and read by the API"""
+
+    def __init__(self, filename: str, path: str, total_bytes: int, mode: str = 'replace',
+                 confirm_deletes: bool = False):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.mode = mode
+        self.confirm_deletes = confirm_deletes  # lets a sync delete most of the master
+        self.status = 'queued'  # queued -> loading -> swapping -> completed | failed
+        self.total_bytes = total_bytes
+        self.bytes_read = 0
+        self.rows_parsed = 0
+        self.rows_staged = 0   # valid rows loaded into the staging table
+        self.rows_skipped = 0  # rows without a security id
+        self.rows_failed = 0   # malformed rows that could not be parsed
+        self.error = None
+        self.summary = None  # added/updated/deleted/unchanged against the live table
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != 'loading' or not self.bytes_read or not self.started_at:
+            return None
+        elapsed = time.time() - self.started_at
+        rate = self.bytes_read / elapsed
+        return round((self.total_bytes - self.bytes_read) / rate, 1) if rate else None
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'mode': self.mode,
+            'rows_parsed': self.rows_parsed,
+            'rows_staged': self.rows_staged,
+            'rows_skipped': self.rows_skipped,
+            'rows_failed': self.rows_failed,
+            'progress': round(self.bytes_read / self.total_bytes, 4) if self.total_bytes else None,
+            'eta_seconds': self.eta_seconds(),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_sec': round(self.rows_parsed / elapsed) if elapsed else None,
+            'summary': self.summary,
+            'error': self.error
+        }
+
+
+class ImportJobManager:
+    """Worker pool plus an in-memory registry of recent jobs
+
+    SQLite allows a single writer, so one worker is the sensible default;
+    further uploads queue behind it instead of fighting for the write lock.
+    """
+
+    def __init__(self, max_workers: int = 1, max_jobs: int = 50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import')
+        self.jobs: 'OrderedDict[str, ImportJob]' = OrderedDict()
+        self.max_jobs = max_jobs
+        self.lock = threading.Lock()
+
+    def submit(self, job: ImportJob, run: Callable[[ImportJob], None]) -> ImportJob:
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self.executor.submit(self._run, job, run)
+        logger.info(f"[Import] Queued job {job.id} for {job.filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: ImportJob, run: Callable[[ImportJob], None]):
+        job.started_at = time.time()
+        job.status = 'loading'
+        try:
+            run(job)
+            job.status = 'completed'
+            logger.info(f"[Import] Job {job.id} completed: {job.summary}")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"[Import] Job {job.id} failed: {e}")
+        finally:
+            job.finished_at = time.time()
@@ -0,0 +1,270 @@
+"""
+In-memory n-gram index for instrument search
+Answers multi-token substring queries from posting lists instead of LIKE scans
+"""
+
+import bisect
+import threading
+import time
+from array import array
+from typing import List, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columns matched by /api/instruments/search (same set as the LIKE query)
+SEARCH_COLUMNS = (
+    'trading_symbol', 'display_name', 'symbol_name',
+    'instrument_name', 'exchange', 'segment'
+)
+
+# Separates column values inside a row's haystack so a token never matches
+# across two columns
+FIELD_SEPARATOR = '\x00'
+
+GRAM_SIZES = (2, 3)
+
+# Positions of the smallest posting list intersected at a time; small enough
+# that a broad query stops after a block or two, large enough that the set
+# operations, not the Python loop, do the work
+INTERSECT_BLOCK = 256
+
+
+def _grams(text: str, size: int):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def _intersect(postings):
+    """Positions present in every sorted posting list, ascending
+
+    Walks the smallest list in blocks of INTERSECT_BLOCK positions and
+    narrows each block against the other lists, smaller ones first: a
+    C-level set intersection with the slice covering the block, or a bisect
+    per survivor once few are left. Results come out block by block, so a
+    search that reaches its limit stops without reading the rest of any
+    list, and an emptied block skips the remaining lists.
+    """
+    postings = sorted(postings, key=len)
+    driver, others = postings[0], postings[1:]
+    for start in range(0, len(driver), INTERSECT_BLOCK):
+        block = driver[start:start + INTERSECT_BLOCK]
+        low, high = block[0], block[-1]
+        matches = set(block)
+        for posting in others:
+            left = bisect.bisect_left(posting, low)
+            right = bisect.bisect_right(posting, high, left)
+            # A bisect costs about as much as hashing a dozen slice entries
+            if len(matches) * 16 < right - left:
+                survivors = set()
+                for position in matches:
+                    index = bisect.bisect_left(posting, position, left, right)
+                    if index < right and posting[index] == position:
+                        survivors.add(position)
+                matches = survivors
+            else:
+                matches.intersection_update(posting[left:right])
+            if not matches:
+                break
+        yield from sorted(matches)
+
+
+def _index_entry(row):
+    """A row's haystack and the set of grams it is posted under"""
+    fields = [(row[col] or '').upper() for col in SEARCH_COLUMNS]
+    row_grams = {
+        field[i:i + size]
+        for field in fields
+        for size in GRAM_SIZES
+        for i in range(len(field) - size + 1)
+    }
+    return FIELD_SEPARATOR.join(fields), row_grams
+
+
+class InstrumentSearchIndex:
+    """Bigram/trigram posting lists over the instrument master
+
+    Rows are kept in id order, so walking a posting list front to back
+    returns matches in the same order as the unordered LIKE query's table
+    scan, and the walk can stop as soon as `limit` rows have matched.
+
+    Single-row writes are applied in place by refresh_row; bulk changes go
+    through rebuild_async, where however many invalidations arrive during
+    a build are served by one more build, not one each.
+    """
+
+    def __init__(self):
+        # (ids, haystacks, postings, positions), replaced as a whole on every build
+        self.snapshot = (array('q'), [], {}, {})
+        self.ready = False
+        self.generation = 0
+        self.building = False
+        self.lock = threading.Lock()
+
+    def build(self, conn):
+        """Build a fresh index from the instruments table and swap it in"""
+        started = time.time()
+        ids = array('q')
+        haystacks = []
+        postings = {}
+        positions = {}
+
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM instruments ORDER BY id"
+        )
+        for row in cursor:
+            position = len(ids)
+            haystack, row_grams = _index_entry(row)
+            ids.append(row['id'])
+            haystacks.append(haystack)
+            positions[row['id']] = position
+            for gram in row_grams:
+                try:
+                    postings[gram].append(position)
+                except KeyError:
+                    postings[gram] = array('I', (position,))
+
+        # Swap in one step so concurrent readers see either index, never a mix
+        self.snapshot = (ids, haystacks, postings, positions)
+        logger.info(
+            f"[SearchIndex] Indexed {len(ids)} instruments, {len(postings)} grams "
+            f"in {time.time() - started:.2f}s"
+        )
+
+    def rebuild_async(self, connect):
+        """Rebuild in a background thread; searches fall back to SQL meanwhile
+
+        Only one builder runs. Invalidations that arrive while it works only
+        bump the generation, and it builds once more at the end, so queued
+        builds of states that are already stale never happen.
+        """
+        with self.lock:
+            self.generation += 1
+            self.ready = False
+            if self.building:
+                return
+            self.building = True
+
+        def run():
+            while True:
+                generation = self.generation
+                conn = connect()
+                try:
+                    self.build(conn)
+                except Exception as e:
+                    logger.error(f"[SearchIndex] Rebuild failed: {e}")
+                    with self.lock:
+                        self.building = False
+                    return
+                finally:
+                    conn.close()
+                with self.lock:
+                    # A newer invalidation means this build is already out of date
+                    if generation == self.generation:
+                        self.ready = True
+                        self.building = False
+                        return
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def refresh_row(self, connect, instrument_id: int):
+        """Re-index one created, updated or deleted row without a full rebuild
+
+        Postings are replaced copy-on-write, so searches running meanwhile
+        keep walking the arrays they started with. A deleted row's haystack
+        becomes None and its stale postings are skipped by verification.
+        While a build is pending, or for a new row that would not sort last,
+        this falls back to rebuild_async.
+        """
+        with self.lock:
+            applied = self.ready and self._apply_row(connect, instrument_id)
+        if not applied:
+            self.rebuild_async(connect)
+
+    def _apply_row(self, connect, instrument_id: int) -> bool:
+        ids, haystacks, postings, positions = self.snapshot
+        conn = connect()
+        try:
+            row = conn.execute(
+                f"SELECT id, {', '.join(SEARCH_COLUMNS)} FROM instruments WHERE id = ?",
+                (instrument_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+
+        position = positions.get(instrument_id)
+        if row is None:
+            if position is not None:
+                haystacks[position] = None
+                del positions[instrument_id]
+            return True
+
+        haystack, row_grams = _index_entry(row)
+        if position is None:
+            if ids and instrument_id < ids[-1]:
+                return False  # would break id order
+            position = len(ids)
+            haystacks.append(haystack)
+            ids.append(instrument_id)
+            positions[instrument_id] = position
+        else:
+            haystacks[position] = haystack
+
+        for gram in row_grams:
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = array('I', (position,))
+                continue
+            index = bisect.bisect_left(posting, position)
+            if index < len(posting) and posting[index] == position:
+                continue
+            updated = array('I', posting)
+            updated.insert(index, position)
+            postings[gram] = updated
+        return True
+
+    @staticmethod
+    def supports(tokens: List[str]) -> bool:
+        """LIKE treats % and _ as wildcards; leave those queries to SQL"""
+        return not any('%' in t or '_' in t or FIELD_SEPARATOR in t for t in tokens)
+
+    def search(self, tokens: List[str], limit: int) -> Optional[List[int]]:
+        """Return ids of rows where every token is a substring of some column
+
+        Tokens must already be upper-cased. Returns None when the index
+        cannot answer the query and the caller should use SQL instead.
+        """
+        if not self.ready or not self.supports(tokens):
+            return None
+        if limit == 0:
+            return []
+
+        ids, haystacks, postings, _ = self.snapshot
+
+        # Candidates are the rows posted under every gram of every token;
+        # single-character tokens have no grams and only get verified.
+        # Grams can come from different columns, so candidates are still verified
+        query_postings = {}
+        for token in tokens:
+            size = min(len(token), GRAM_SIZES[-1])
+            if size < GRAM_SIZES[0]:
+                continue
+            for gram in _grams(token, size):
+                posting = postings.get(gram)
+                if posting is None:
+                    return []
+                query_postings[gram] = posting
+
+        candidates = _intersect(query_postings.values()) if query_postings else range(len(ids))
+        results = []
+        for position in candidates:
+            haystack = haystacks[position]
+            if haystack is not None and all(token in haystack for token in tokens):
+                results.append(ids[position])
+                if len(results) == limit:
+                    break
+        return results
+
+
+search_index = InstrumentSearchIndex()
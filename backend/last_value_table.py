@@ -0,0 +1,192 @@
+"""
+Shared-memory last-value table for live feed prices
+The WebSocket server writes every tick; the Flask process reads LTPs without a network hop
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Dict, Iterable, Optional, Tuple
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# DhanHQ numeric exchange segment codes, as sent in binary feed headers
+EXCHANGE_SEGMENT_CODES = {
+    'IDX_I': 0,
+    'NSE_EQ': 1,
+    'NSE_FNO': 2,
+    'NSE_CURRENCY': 3,
+    'BSE_EQ': 4,
+    'MCX_COMM': 5,
+    'BSE_CURRENCY': 7,
+    'BSE_FNO': 8,
+}
+EXCHANGE_SEGMENT_NAMES = {code: name for name, code in EXCHANGE_SEGMENT_CODES.items()}
+
+SHM_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+DEFAULT_PATH = os.path.join(SHM_DIR, 'dhanhq-last-values.bin')
+DEFAULT_CAPACITY = 1 << 16  # slots; must be a power of two
+
+MAGIC = 0x4C545631  # "LTV1"
+# magic, capacity, writer pid, heartbeat (wall clock)
+HEADER = struct.Struct('<IIId')
+HEADER_SIZE = 64
+# seq, flags, segment, pad, security_id, ltp, ltt, updated_at (wall clock)
+SLOT = struct.Struct('<IBBHIdId')
+SEQ = struct.Struct('<I')
+
+FLAG_USED = 1
+FLAG_ACTIVE = 2
+
+# Keep probe chains short; the writer stops adding keys past this load
+MAX_LOAD = 0.75
+
+
+def _slot_index(segment: int, security_id: int, capacity: int) -> int:
+    return ((security_id * 31 + segment) * 2654435761) & (capacity - 1)
+
+
+class LastValueTable:
+    """Writer side: one process (the feed owner) maps the file read-write
+
+    Each slot is guarded by a sequence counter (a seqlock): the writer makes
+    it odd before touching the slot and even afterwards, so readers in
+    other processes can detect and retry a torn read without any locking.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, capacity: int = DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.slots: Dict[Tuple[int, int], int] = {}
+        size = HEADER_SIZE + capacity * SLOT.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.buffer = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.buffer[:] = bytes(size)
+        HEADER.pack_into(self.buffer, 0, MAGIC, capacity, os.getpid(), time.time())
+        logger.info(f"[LastValues] Writing {capacity} slots to {path}")
+
+    def _slot_for(self, segment: int, security_id: int) -> Optional[int]:
+        key = (segment, security_id)
+        index = self.slots.get(key)
+        if index is not None:
+            return index
+        if len(self.slots) >= self.capacity * MAX_LOAD:
+            return None
+        index = _slot_index(segment, security_id, self.capacity)
+        while True:
+            flags = self.buffer[HEADER_SIZE + index * SLOT.size + 4]
+            if not flags & FLAG_USED:
+                self.slots[key] = index
+                return index
+            index = (index + 1) & (self.capacity - 1)
+
+    def update(self, segment: int, security_id: int, ltp: float, ltt: int):
+        index = self._slot_for(segment, security_id)
+        if index is None:
+            return
+        offset = HEADER_SIZE + index * SLOT.size
+        seq = SEQ.unpack_from(self.buffer, offset)[0]
+        SEQ.pack_into(self.buffer, offset, seq + 1)
+        SLOT.pack_into(self.buffer, offset, seq + 1, FLAG_USED | FLAG_ACTIVE, segment, 0,
+                       security_id, ltp, ltt, time.time())
+        SEQ.pack_into(self.buffer, offset, seq + 2)
+
+    def deactivate(self, segment: int, security_id: int):
+        """Stop serving an instrument the feed is no longer subscribed to"""
+        index = self.slots.get((segment, security_id))
+        if index is None:
+            return
+        offset = HEADER_SIZE + index * SLOT.size
+        seq, flags, *rest = SLOT.unpack_from(self.buffer, offset)
+        SEQ.pack_into(self.buffer, offset, seq + 1)
+        SLOT.pack_into(self.buffer, offset, seq + 1, flags & ~FLAG_ACTIVE, *rest)
+        SEQ.pack_into(self.buffer, offset, seq + 2)
+
+    def heartbeat(self):
+        """Mark the feed alive; readers ignore the table once this goes stale"""
+        HEADER.pack_into(self.buffer, 0, MAGIC, self.capacity, os.getpid(), time.time())
+
+    def close(self):
+        HEADER.pack_into(self.buffer, 0, MAGIC, self.capacity, os.getpid(), 0.0)
+        self.buffer.close()
+
+
+class LastValueReader:
+    """Reader side: any number of processes map the file read-only"""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_heartbeat_age: float = 5.0):
+        self.path = path
+        self.max_heartbeat_age = max_heartbeat_age
+        self.buffer = None
+        self.capacity = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self) -> bool:
+        try:
+            with open(self.path, 'rb') as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        magic, capacity, _, _ = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or len(buffer) < HEADER_SIZE + capacity * SLOT.size:
+            buffer.close()
+            return False
+        self.buffer, self.capacity = buffer, capacity
+        return True
+
+    def is_live(self) -> bool:
+        if self.buffer is None and not self._open():
+            return False
+        heartbeat = HEADER.unpack_from(self.buffer, 0)[3]
+        return time.time() - heartbeat < self.max_heartbeat_age
+
+    def _read(self, segment: int, security_id: int):
+        buffer, capacity = self.buffer, self.capacity
+        index = _slot_index(segment, security_id, capacity)
+        for _ in range(capacity):
+            offset = HEADER_SIZE + index * SLOT.size
+            for _ in range(3):
+                slot = SLOT.unpack_from(buffer, offset)
+                if slot[0] % 2 == 0 and SEQ.unpack_from(buffer, offset)[0] == slot[0]:
+                    break
+            else:
+                return None  # writer kept the slot busy; let the caller fall back
+            seq, flags, slot_segment, _, slot_security_id, ltp, ltt, updated_at = slot
+            if not flags & FLAG_USED:
+                return None
+            if slot_segment == segment and slot_security_id == security_id:
+                return slot if flags & FLAG_ACTIVE else None
+            index = (index + 1) & (capacity - 1)
+        return None
+
+    def lookup(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], dict]:
+        """LTP payloads for the (segment name, security_id) keys the feed carries"""
+        keys = list(keys)
+        prices = {}
+        if not self.is_live():
+            return prices
+        for key in keys:
+            segment = EXCHANGE_SEGMENT_CODES.get(key[0])
+            try:
+                security_id = int(key[1])
+            except ValueError:
+                continue
+            slot = self._read(segment, security_id) if segment is not None else None
+            if slot is None:
+                continue
+            prices[key] = {'last_price': round(slot[5], 2), 'ltt': slot[6]}
+        self.hits += len(prices)
+        self.misses += len(keys) - len(prices)
+        return prices
+
+    def stats(self) -> dict:
+        return {'live': self.is_live(), 'hits': self.hits, 'misses': self.misses}
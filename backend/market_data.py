@@ -0,0 +1,386 @@
+"""
+Market data helpers for the REST price endpoints
+Coalesces concurrent LTP lookups into shared upstream DhanHQ calls
+"""
+
+import json
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from cache import LRUCache, StripedLRUCache
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+InstrumentKey = Tuple[str, str]  # (exchange_segment, security_id)
+
+
+class UpstreamError(Exception):
+    """A failed DhanHQ call, carrying what should be relayed to the client"""
+
+    def __init__(self, status_code: int, body):
+        super().__init__(f"DhanHQ returned {status_code}")
+        self.status_code = status_code
+        self.body = body
+
+
+def parse_ltp_request(body) -> List[InstrumentKey]:
+    """Instrument keys from a /api/market/ltp body
+
+    Accepts DhanHQ's own shape, {"NSE_EQ": [11536, ...]}, and the
+    {"instruments": [{"exchange_segment", "security_id"}]} shape some
+    watchlist pages send. Security ids are checked here, so a bad one is
+    the caller's 400 rather than a failure of the upstream call it would
+    share with other requests; raises ValueError for non-numeric ids.
+    """
+    keys = []
+    if not isinstance(body, dict):
+        return keys
+    if isinstance(body.get('instruments'), list):
+        for inst in body['instruments']:
+            if isinstance(inst, dict) and inst.get('exchange_segment') and inst.get('security_id'):
+                keys.append((str(inst['exchange_segment']), _security_id(inst['security_id'])))
+        return keys
+    for segment, security_ids in body.items():
+        if isinstance(security_ids, list):
+            keys.extend((segment, _security_id(sid)) for sid in security_ids)
+    return keys
+
+
+def parse_ltp_query(value: str) -> List[InstrumentKey]:
+    """Instrument keys from a GET query value, "NSE_EQ:11536,NSE_FNO:35001"
+
+    Raises ValueError for malformed entries, like parse_ltp_request.
+    """
+    keys = []
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        segment, sep, security_id = item.strip().partition(':')
+        if not sep or not segment:
+            raise ValueError(f"Invalid instrument: {item!r}")
+        keys.append((segment, _security_id(security_id)))
+    return keys
+
+
+def _security_id(value) -> str:
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid security_id: {value!r}")
+    try:
+        return str(int(value))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid security_id: {value!r}")
+
+
+def build_ltp_request(keys: Iterable[InstrumentKey]) -> Dict[str, List[int]]:
+    grouped: Dict[str, List[int]] = {}
+    for segment, security_id in keys:
+        grouped.setdefault(segment, []).append(int(security_id))
+    return grouped
+
+
+def build_ltp_response(prices: Dict[InstrumentKey, dict]) -> dict:
+    """DhanHQ's response shape: {"data": {"NSE_EQ": {"11536": {...}}}, "status": "success"}"""
+    data: Dict[str, Dict[str, dict]] = {}
+    for (segment, security_id), payload in prices.items():
+        data.setdefault(segment, {})[security_id] = payload
+    return {'data': data, 'status': 'success'}
+
+
+def split_ltp_response(result: dict) -> Dict[InstrumentKey, dict]:
+    prices = {}
+    for segment, entries in (result.get('data') or {}).items():
+        if isinstance(entries, dict):
+            for security_id, payload in entries.items():
+                prices[(segment, str(security_id))] = payload
+    return prices
+
+
+class LtpStore:
+    """Last known price per (segment, security_id), each with its own age
+
+    Every request is answered from whatever entries are still fresh, so two
+    users, or one user asking in a different order or with one extra symbol,
+    share entries instead of missing on a per-request-body key. Entries live
+    in a striped LRU cache whose TTL is the freshness window.
+    """
+
+    def __init__(self, max_age: float, max_size: int = 50000):
+        self.max_age = max_age
+        self.entries = StripedLRUCache(max_size, ttl=max_age)
+
+    def lookup(self, keys: Iterable[InstrumentKey]) -> Tuple[Dict[InstrumentKey, dict], List[InstrumentKey]]:
+        """Split `keys` into fresh prices and the stale/unknown keys to fetch"""
+        fresh = {}
+        stale = {}  # insertion-ordered set
+        for key in keys:
+            payload = self.entries.get(key)
+            if payload is not None:
+                fresh[key] = payload
+            else:
+                stale[key] = None
+        return fresh, list(stale)
+
+    def update(self, prices: Dict[InstrumentKey, dict]):
+        for key, payload in prices.items():
+            self.entries.put(key, payload)
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+class PriceVersions:
+    """Sequence number per instrument, bumped whenever its payload changes
+
+    Every price a request sees is observed here; a change takes the next
+    value of one process-wide counter. A polling client that remembers the
+    highest sequence it was sent can then be answered with just the
+    instruments that moved since, or with nothing at all.
+
+    The counter only means something within this process, so clients are
+    given tokens of the form "<epoch>.<seq>" with a per-boot epoch. A token
+    from before a restart or from another worker does not resolve, and its
+    holder gets a full response instead of a stale 304.
+    """
+
+    def __init__(self, max_size: int = 50000, ttl: float = 3600):
+        self.entries = StripedLRUCache(max_size, ttl=ttl)  # key -> (payload, seq)
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def token(self, seq: int) -> str:
+        return f'{self.epoch}.{seq}'
+
+    def resolve(self, token: Optional[str]) -> Optional[int]:
+        """The sequence a client's token stands for, or None if it is not one of ours"""
+        epoch, _, seq = (token or '').partition('.')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        return seq if seq <= self.seq else None
+
+    def observe(self, prices: Dict[InstrumentKey, dict]) -> Dict[InstrumentKey, int]:
+        seqs = {}
+        for key, payload in prices.items():
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == payload:
+                seqs[key] = entry[1]
+                continue
+            with self.lock:
+                self.seq += 1
+                seqs[key] = self.seq
+            self.entries.put(key, (payload, seqs[key]))
+        return seqs
+
+    def stats(self) -> dict:
+        stats = self.entries.stats()
+        stats['seq'] = self.seq
+        stats['epoch'] = self.epoch
+        return stats
+
+
+class _Batch:
+    def __init__(self, credentials):
+        self.credentials = credentials
+        self.keys = set()
+        self.done = threading.Event()
+        self.prices: Dict[InstrumentKey, dict] = {}
+        self.error = None
+
+
+class LtpBatcher:
+    """Single-flight LTP fetches shared by every concurrent caller
+
+    The first caller with an instrument that is not already being fetched
+    opens a batch and waits `window` seconds for others to join. Callers
+    arriving meanwhile add their missing instruments to that batch, and
+    callers whose instruments are already in flight simply wait on the
+    batch fetching them. Upstream calls therefore scale with the number of
+    distinct instruments per window, not with the number of clients.
+
+    With a `reserve` hook (a rate limiter reservation for the batch's
+    credentials, returning the seconds to wait or None to refuse) the batch
+    stays open until its upstream slot comes up, so callers throttled by
+    DhanHQ's limits pile into one larger request instead of queueing
+    separate ones.
+
+    Batches are kept per DhanHQ credentials: callers only share upstream
+    calls made with their own account, so one user's expired token fails
+    only that user's requests.
+    """
+
+    def __init__(self, fetch_upstream: Callable[[List[InstrumentKey], tuple], Dict[InstrumentKey, dict]],
+                 window: float = 0.01, timeout: float = 5.0,
+                 reserve: Optional[Callable[[tuple], Optional[float]]] = None):
+        self.fetch_upstream = fetch_upstream
+        self.window = window
+        self.timeout = timeout
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.inflight: Dict[Tuple[tuple, InstrumentKey], _Batch] = {}
+        self.pending: Dict[tuple, _Batch] = {}  # credentials -> batch still accepting instruments
+        self.upstream_calls = 0
+        self.coalesced_requests = 0
+        self.throttled_batches = 0
+        self.rejected_batches = 0
+        self.waiting_callers = 0
+
+    def get(self, keys: Iterable[InstrumentKey], credentials: tuple) -> Dict[InstrumentKey, dict]:
+        """Prices for `keys`; raises UpstreamError if the shared fetch failed"""
+        keys = list(keys)
+        lead = None
+        waits = set()
+        with self.lock:
+            for key in keys:
+                batch = self.inflight.get((credentials, key))
+                if batch is None:
+                    batch = self.pending.get(credentials)
+                    if batch is None:
+                        self.pending[credentials] = batch = lead = _Batch(credentials)
+                    batch.keys.add(key)
+                    self.inflight[(credentials, key)] = batch
+                waits.add(batch)
+            if lead is None:
+                self.coalesced_requests += 1
+
+        if lead is not None:
+            delay = self.window
+            if self.reserve is not None:
+                wait = self.reserve(lead.credentials)
+                if wait is None:
+                    self.rejected_batches += 1
+                    self._close(lead)
+                    self._finish(lead, UpstreamError(429, {'error': 'DhanHQ rate limit reached, retry shortly'}))
+                elif wait > self.window:
+                    self.throttled_batches += 1
+                    delay = wait
+            if not lead.done.is_set():
+                time.sleep(delay)
+                self._close(lead)
+                self._run(lead)
+
+        with self.lock:
+            self.waiting_callers += 1
+        try:
+            for batch in waits:
+                if not batch.done.wait(self.timeout):
+                    raise UpstreamError(504, {'error': 'DhanHQ API timeout'})
+                if batch.error is not None:
+                    raise batch.error
+        finally:
+            with self.lock:
+                self.waiting_callers -= 1
+        # Batches also carry other callers' instruments; return only ours
+        prices = {}
+        for key in keys:
+            for batch in waits:
+                if key in batch.prices:
+                    prices[key] = batch.prices[key]
+                    break
+        return prices
+
+    def _close(self, batch: _Batch):
+        """Stop `batch` accepting instruments; later callers open a new one"""
+        with self.lock:
+            if self.pending.get(batch.credentials) is batch:
+                del self.pending[batch.credentials]
+
+    def _run(self, batch: _Batch):
+        error = None
+        try:
+            self.upstream_calls += 1
+            batch.prices = self.fetch_upstream(sorted(batch.keys), batch.credentials)
+        except UpstreamError as e:
+            error = e
+        except Exception as e:
+            logger.error(f"[LTP] Upstream fetch failed: {e}")
+            error = UpstreamError(500, {'error': str(e)})
+        finally:
+            self._finish(batch, error)
+
+    def _finish(self, batch: _Batch, error: Optional[UpstreamError] = None):
+        batch.error = error
+        with self.lock:
+            for key in batch.keys:
+                if self.inflight.get((batch.credentials, key)) is batch:
+                    del self.inflight[(batch.credentials, key)]
+        batch.done.set()
+
+    def stats(self) -> dict:
+        return {
+            'upstream_calls': self.upstream_calls,
+            'coalesced_requests': self.coalesced_requests,
+            'throttled_batches': self.throttled_batches,
+            'rejected_batches': self.rejected_batches,
+            'waiting_callers': self.waiting_callers,
+            'inflight_instruments': len(self.inflight)
+        }
+
+
+def format_sse(event: str, data, event_id=None) -> str:
+    """One Server-Sent Events message; `data` is sent as a single JSON line"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class PriceStream:
+    """An instrument set registered once and then streamed over SSE"""
+
+    def __init__(self, keys: List[InstrumentKey], credentials: tuple):
+        self.id = uuid.uuid4().hex
+        self.keys = keys
+        self.credentials = credentials
+        self.created_at = time.time()
+
+
+class PriceStreamRegistry:
+    """Registered price streams, expiring if nobody connects for `ttl` seconds
+
+    EventSource can only issue GETs without custom headers, so clients POST
+    their instruments and credentials header once and then open the stream
+    by id; reconnects reuse the same registration.
+    """
+
+    def __init__(self, max_streams: int = 10000, ttl: float = 3600):
+        self.streams = LRUCache(max_streams, ttl)
+        self.lock = threading.Lock()
+        self.connected = 0
+        self.events_sent = 0
+
+    def register(self, keys: List[InstrumentKey], credentials: tuple) -> PriceStream:
+        stream = PriceStream(keys, credentials)
+        self.streams.put(stream.id, stream)
+        return stream
+
+    def get(self, stream_id: str):
+        stream = self.streams.get(stream_id)
+        if stream is not None:
+            self.streams.put(stream_id, stream)  # connecting renews the registration
+        return stream
+
+    def opened(self):
+        with self.lock:
+            self.connected += 1
+
+    def closed(self):
+        with self.lock:
+            self.connected -= 1
+
+    def sent(self):
+        with self.lock:
+            self.events_sent += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'registered': self.streams.stats()['size'],
+                'connected': self.connected,
+                'events_sent': self.events_sent
+            }
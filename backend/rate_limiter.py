@@ -0,0 +1,172 @@
+"""
+Token-bucket rate limiting for DhanHQ REST calls
+Keeps every outbound request within DhanHQ's per-account, per-endpoint-category limits
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# DhanHQ v2 published limits, requests per second per category for each account
+DHAN_RATE_LIMITS = {
+    'quote': 1,         # marketfeed/ltp, ohlc, quote
+    'data': 5,          # historical / intraday charts
+    'order': 25,        # order placement and modification
+    'non_trading': 20,  # funds, positions, holdings, order book
+}
+
+# Instruments accepted in one marketfeed request
+QUOTE_MAX_INSTRUMENTS = 1000
+
+
+class RateLimitExceeded(Exception):
+    """The call could not get a token within its bounded wait"""
+
+
+class TokenBucket:
+    """Tokens refill at `rate` per second up to `capacity`
+
+    Callers reserve a token up front, possibly driving the balance negative,
+    which queues them FIFO: each later caller waits for the deficit ahead of
+    it plus its own token. Reservations that would wait longer than the
+    caller's bound are refused instead, so bursts turn into backpressure
+    rather than an unbounded queue.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait: float) -> Optional[float]:
+        """Seconds to wait before calling, or None if that exceeds `max_wait`"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class DhanRateLimiter:
+    """One token bucket per DhanHQ endpoint category, plus metrics"""
+
+    def __init__(self, limits: Dict[str, float] = DHAN_RATE_LIMITS, max_wait: float = 3.0):
+        self.buckets = {category: TokenBucket(rate) for category, rate in limits.items()}
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.metrics = {
+            category: {'calls': 0, 'throttled': 0, 'rejected': 0, 'waiting': 0, 'max_wait': 0.0}
+            for category in limits
+        }
+
+    def reserve(self, category: str, max_wait: Optional[float] = None) -> Optional[float]:
+        """Reserve a slot without sleeping; returns the wait, or None when rejected"""
+        wait = self.buckets[category].reserve(self.max_wait if max_wait is None else max_wait)
+        with self.lock:
+            metrics = self.metrics[category]
+            if wait is None:
+                metrics['rejected'] += 1
+                logger.warning(f"[RateLimit] Rejected {category} call, queue too deep")
+                return None
+            metrics['calls'] += 1
+            if wait > 0:
+                metrics['throttled'] += 1
+                metrics['max_wait'] = max(metrics['max_wait'], round(wait, 3))
+        return wait
+
+    def acquire(self, category: str, max_wait: Optional[float] = None):
+        """Block until the call may go out; raises RateLimitExceeded instead of queueing forever"""
+        wait = self.reserve(category, max_wait)
+        if wait is None:
+            raise RateLimitExceeded(f"DhanHQ {category} rate limit reached")
+        if wait > 0:
+            with self.lock:
+                self.metrics[category]['waiting'] += 1
+            try:
+                time.sleep(wait)
+            finally:
+                with self.lock:
+                    self.metrics[category]['waiting'] -= 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {category: dict(metrics) for category, metrics in self.metrics.items()}
+
+
+class AccountRateLimiters:
+    """One DhanRateLimiter per DhanHQ account
+
+    DhanHQ enforces its limits per client id, so accounts get their own
+    buckets and one busy user cannot spend another's quota. A limiter idle
+    for `idle_ttl` seconds has long since refilled and is dropped; the next
+    call for that account starts a fresh one with identical state. Metrics
+    of dropped limiters are folded into the totals.
+    """
+
+    COUNTERS = ('calls', 'throttled', 'rejected')
+
+    def __init__(self, limits: Dict[str, float] = DHAN_RATE_LIMITS, max_wait: float = 3.0,
+                 idle_ttl: float = 600):
+        self.limits = limits
+        self.max_wait = max_wait
+        self.idle_ttl = idle_ttl
+        self.limiters: 'OrderedDict[str, DhanRateLimiter]' = OrderedDict()  # least recently used first
+        self.last_used: Dict[str, float] = {}
+        self.retired = {category: dict(dict.fromkeys(self.COUNTERS, 0), max_wait=0.0) for category in limits}
+        self.evicted = 0
+        self.lock = threading.Lock()
+
+    def get(self, account: str) -> DhanRateLimiter:
+        now = time.monotonic()
+        with self.lock:
+            while self.limiters:
+                oldest = next(iter(self.limiters))
+                if now - self.last_used[oldest] < self.idle_ttl:
+                    break
+                self._retire(oldest)
+            limiter = self.limiters.get(account)
+            if limiter is None:
+                limiter = self.limiters[account] = DhanRateLimiter(self.limits, self.max_wait)
+            else:
+                self.limiters.move_to_end(account)
+            self.last_used[account] = now
+            return limiter
+
+    def _retire(self, account: str):
+        limiter = self.limiters.pop(account)
+        del self.last_used[account]
+        for category, metrics in limiter.stats().items():
+            for counter in self.COUNTERS:
+                self.retired[category][counter] += metrics[counter]
+            self.retired[category]['max_wait'] = max(self.retired[category]['max_wait'], metrics['max_wait'])
+        self.evicted += 1
+
+    def reserve(self, account: str, category: str, max_wait: Optional[float] = None) -> Optional[float]:
+        return self.get(account).reserve(category, max_wait)
+
+    def acquire(self, account: str, category: str, max_wait: Optional[float] = None):
+        self.get(account).acquire(category, max_wait)
+
+    def stats(self) -> dict:
+        with self.lock:
+            limiters = list(self.limiters.values())
+            totals = {category: dict(retired, waiting=0) for category, retired in self.retired.items()}
+            evicted = self.evicted
+        for limiter in limiters:
+            for category, metrics in limiter.stats().items():
+                total = totals[category]
+                for counter in self.COUNTERS + ('waiting',):
+                    total[counter] += metrics[counter]
+                total['max_wait'] = max(total['max_wait'], metrics['max_wait'])
+        return {'accounts': len(limiters), 'evicted': evicted, 'categories': totals}
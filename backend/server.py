@@ -1,19 +1,61 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import (Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context,
+                   g, has_request_context)
 from flask_cors import CORS
 import sqlite3
 import csv
 import io
+import base64
+import json
+import zlib
+import time
+import os
+import tempfile
+import itertools
+import hashlib
 from datetime import datetime
+from instrument_index import search_index
+from cache import StripedLRUCache
+from db import ConnectionPool
+from last_value_table import LastValueReader
+from rate_limiter import AccountRateLimiters, RateLimitExceeded, QUOTE_MAX_INSTRUMENTS
+from import_jobs import ImportJob, ImportJobManager
+from market_data import (
+    LtpBatcher, LtpStore, UpstreamError, parse_ltp_request, parse_ltp_query, build_ltp_request,
+    build_ltp_response, split_ltp_response, format_sse, PriceStreamRegistry, PriceVersions
+)
+import threading
 
 app = Flask(__name__, static_folder='../frontend', static_url_path='')
 CORS(app)
 
 DATABASE = '/home/ubuntu/dhanhq-app/data/instruments.db'
+db_pool = ConnectionPool(DATABASE)
+
+# Search results cache; entries are keyed on the instrument master generation,
+# which every instrument write bumps, so stale results are never served
+SEARCH_CACHE_SIZE = 4096
+SEARCH_CACHE_TTL = 300  # seconds
+search_cache = StripedLRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+instrument_generation = 0
+generation_lock = threading.Lock()
 
 def get_db():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    # A request checks one connection out of the pool and keeps it until
+    # teardown, so conn.close() in handlers only rolls back. Outside a
+    # request (startup, import jobs, the search index builder) close()
+    # returns the connection to the pool.
+    if not has_request_context():
+        return db_pool.acquire()
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+        g.db.request_bound = True
+    return g.db
+
+@app.teardown_request
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
 
 def init_db():
     conn = get_db()
@@ -43,6 +85,12 @@ def init_db():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_display_name ON instruments(display_name)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_exchange ON instruments(exchange)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_segment ON instruments(segment)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_instrument_type ON instruments(instrument_type)')
+    
+    # Hash of the row's imported fields, compared by sync-mode uploads
+    cursor.execute('PRAGMA table_info(instruments)')
+    if 'row_hash' not in [column['name'] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE instruments ADD COLUMN row_hash TEXT')
     
     # Create watchlist table
     cursor.execute('''
@@ -69,9 +117,82 @@ def init_db():
         )
     ''')
     
+    init_fts(cursor)
+    
     conn.commit()
     conn.close()
 
+# Full-text index over the searchable instrument columns (search mode=fts).
+# External-content table: rows live in `instruments`, FTS5 stores only the index.
+# exchange and segment are UNINDEXED: a handful of values shared by every row,
+# so as terms "NSE" matched the whole table and ranking then sorted all of it.
+FTS_ENABLED = False
+# A query needs one token at least this long to use the index; shorter
+# prefixes match a large share of it and go to the LIKE/n-gram path instead
+FTS_MIN_PREFIX = 3
+# Matches handed to ranking, which sorts every candidate before the LIMIT
+FTS_MAX_CANDIDATES = 2000
+# Exchange names in a query filter on the exchange column
+FTS_EXCHANGES = ('NSE', 'BSE', 'MCX')
+
+def init_fts(cursor):
+    global FTS_ENABLED
+    try:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'instruments_fts'")
+        existing = cursor.fetchone()
+        if existing is not None and 'UNINDEXED' not in existing['sql']:
+            # Built before exchange/segment were unindexed; recreated and rebuilt below
+            cursor.execute('DROP TABLE instruments_fts')
+            existing = None
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS instruments_fts USING fts5(
+                trading_symbol, display_name, symbol_name,
+                instrument_name, exchange UNINDEXED, segment UNINDEXED,
+                content='instruments', content_rowid='id',
+                prefix='2 3 4'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 unavailable, mode=fts falls back to LIKE search: {e}")
+        return
+    
+    # Keep the index in sync with single-row changes
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS instruments_fts_ai AFTER INSERT ON instruments BEGIN
+            INSERT INTO instruments_fts(rowid, trading_symbol, display_name, symbol_name,
+                                        instrument_name, exchange, segment)
+            VALUES (new.id, new.trading_symbol, new.display_name, new.symbol_name,
+                    new.instrument_name, new.exchange, new.segment);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS instruments_fts_ad AFTER DELETE ON instruments BEGIN
+            INSERT INTO instruments_fts(instruments_fts, rowid, trading_symbol, display_name,
+                                        symbol_name, instrument_name, exchange, segment)
+            VALUES ('delete', old.id, old.trading_symbol, old.display_name, old.symbol_name,
+                    old.instrument_name, old.exchange, old.segment);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS instruments_fts_au AFTER UPDATE ON instruments BEGIN
+            INSERT INTO instruments_fts(instruments_fts, rowid, trading_symbol, display_name,
+                                        symbol_name, instrument_name, exchange, segment)
+            VALUES ('delete', old.id, old.trading_symbol, old.display_name, old.symbol_name,
+                    old.instrument_name, old.exchange, old.segment);
+            INSERT INTO instruments_fts(rowid, trading_symbol, display_name, symbol_name,
+                                        instrument_name, exchange, segment)
+            VALUES (new.id, new.trading_symbol, new.display_name, new.symbol_name,
+                    new.instrument_name, new.exchange, new.segment);
+        END
+    ''')
+    if existing is None:
+        rebuild_fts(cursor)
+    FTS_ENABLED = True
+
+def rebuild_fts(cursor):
+    # Resync the whole index from the content table
+    cursor.execute("INSERT INTO instruments_fts(instruments_fts) VALUES ('rebuild')")
+
 @app.route('/')
 def index():
     return send_from_directory('../frontend', 'index.html')
@@ -88,28 +209,182 @@ def serve_websocket_handler():
 def serve_debug_console():
     return send_file('../frontend/debug-console.html')
 
+# Instrument columns served to clients; row_hash is sync bookkeeping and stays internal
+INSTRUMENT_FIELDS = '''
+    id, security_id, exchange, segment, instrument_name,
+    trading_symbol, display_name, lot_size, expiry_date,
+    strike_price, option_type, tick_size, expiry_flag,
+    instrument_type, series, symbol_name, created_at
+'''
+
 @app.route('/api/instruments', methods=['GET'])
 def get_instruments():
+    # Passing `cursor` (empty for the first page) switches to keyset pagination
+    if 'cursor' in request.args:
+        return get_instruments_page()
+    
     conn = get_db()
     cursor = conn.cursor()
     limit = request.args.get('limit', 100, type=int)
     offset = request.args.get('offset', 0, type=int)
-    cursor.execute('SELECT * FROM instruments LIMIT ? OFFSET ?', (limit, offset))
+    cursor.execute(f'SELECT {INSTRUMENT_FIELDS} FROM instruments LIMIT ? OFFSET ?', (limit, offset))
     instruments = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return jsonify(instruments)
 
+PAGE_FILTERS = ('segment', 'exchange', 'instrument_type')
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(f'id:{last_id}'.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    if not token:
+        return 0
+    padded = token + '=' * (-len(token) % 4)
+    prefix, _, last_id = base64.urlsafe_b64decode(padded).decode().partition(':')
+    if prefix != 'id':
+        raise ValueError('bad cursor')
+    return int(last_id)
+
+def get_instruments_page():
+    limit = max(1, min(request.args.get('limit', 100, type=int), MAX_PAGE_SIZE))
+    try:
+        after_id = decode_cursor(request.args.get('cursor', ''))
+    except (ValueError, UnicodeDecodeError):
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Seek past the last id seen instead of counting rows with OFFSET, so
+    # every page costs one index range scan; the single-column filter indexes
+    # carry the rowid, which keeps "col = ? AND id > ? ORDER BY id" ordered
+    where_conditions = ['id > ?']
+    params = [after_id]
+    for column in PAGE_FILTERS:
+        value = request.args.get(column)
+        if value:
+            where_conditions.append(f'{column} = ?')
+            params.append(value)
+    params.append(limit)
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {INSTRUMENT_FIELDS} FROM instruments WHERE {' AND '.join(where_conditions)} ORDER BY id LIMIT ?",
+        params
+    )
+    instruments = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    
+    next_cursor = encode_cursor(instruments[-1]['id']) if len(instruments) == limit else None
+    return jsonify({'data': instruments, 'next_cursor': next_cursor})
+
+EXPORT_CHUNK_ROWS = 1000
+
+@app.route('/api/instruments/export', methods=['GET'])
+def export_instruments():
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    use_gzip = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    
+    where_conditions = []
+    params = []
+    for column in PAGE_FILTERS:
+        value = request.args.get(column)
+        if value:
+            where_conditions.append(f'{column} = ?')
+            params.append(value)
+    where_clause = f"WHERE {' AND '.join(where_conditions)}" if where_conditions else ''
+    
+    def generate_chunks():
+        # Rows are pulled from the cursor a chunk at a time and never
+        # collected, so memory stays flat regardless of master size
+        conn = get_db()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT {INSTRUMENT_FIELDS} FROM instruments {where_clause} ORDER BY id', params)
+            columns = [d[0] for d in cursor.description]
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                writer.writerow(columns)
+                yield buffer.getvalue()
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                buffer.seek(0)
+                buffer.truncate()
+                if export_format == 'csv':
+                    writer.writerows(rows)
+                else:
+                    for row in rows:
+                        buffer.write(json.dumps(dict(zip(columns, row))))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+        finally:
+            conn.close()
+    
+    def generate_bytes():
+        if not use_gzip:
+            for chunk in generate_chunks():
+                yield chunk.encode('utf-8')
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in generate_chunks():
+            # Sync-flush each chunk so the client starts receiving immediately
+            yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    headers = {'Content-Disposition': f'attachment; filename=instruments.{export_format}'}
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(generate_bytes()), mimetype=mimetype, headers=headers)
+
 @app.route('/api/instruments/search', methods=['GET'])
 def search_instruments():
     query = request.args.get('query', '').strip()
     limit = request.args.get('limit', 100, type=int)
+    mode = request.args.get('mode', 'like')
     
     if not query:
         return jsonify([])
     
+    tokens = query.upper().split()
+    if mode != 'fts' or not FTS_ENABLED:
+        mode = 'like'
+    
+    # LIKE matching is order-independent, so "25 NIFTY" shares "NIFTY 25"'s entry;
+    # FTS ranking looks at the phrase, so it keeps token order
+    key_tokens = tuple(sorted(set(tokens))) if mode == 'like' else tuple(tokens)
+    cache_key = (instrument_generation, mode, key_tokens, limit)
+    instruments = search_cache.get(cache_key)
+    if instruments is not None:
+        return jsonify(instruments)
+    
     conn = get_db()
     cursor = conn.cursor()
-    tokens = query.upper().split()
+    if mode == 'fts':
+        instruments = search_instruments_fts(cursor, tokens, limit)
+    if instruments is None:
+        # Serve from the in-memory n-gram index when it is built
+        ids = search_index.search(tokens, limit)
+        if ids is not None:
+            instruments = fetch_instruments_by_ids(cursor, ids)
+        else:
+            instruments = search_instruments_sql(cursor, tokens, limit)
+    conn.close()
+    search_cache.put(cache_key, instruments)
+    return jsonify(instruments)
+
+@app.route('/api/instruments/search/stats', methods=['GET'])
+def search_cache_stats():
+    stats = search_cache.stats()
+    stats['generation'] = instrument_generation
+    return jsonify(stats)
+
+def search_instruments_sql(cursor, tokens, limit):
     where_conditions = []
     params = []
     
@@ -126,13 +401,87 @@ def search_instruments():
         params.extend([pattern] * 6)
     
     where_clause = ' AND '.join(where_conditions)
-    query_sql = f'SELECT * FROM instruments WHERE {where_clause} LIMIT ?'
+    query_sql = f'SELECT {INSTRUMENT_FIELDS} FROM instruments WHERE {where_clause} LIMIT ?'
     params.append(limit)
     
     cursor.execute(query_sql, params)
-    instruments = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify(instruments)
+    return [dict(row) for row in cursor.fetchall()]
+
+def search_instruments_fts(cursor, tokens, limit):
+    # None when the query is too short for the index; the caller uses LIKE
+    exchanges = sorted({token for token in tokens if token in FTS_EXCHANGES})
+    terms = [token for token in tokens if token not in FTS_EXCHANGES]
+    if not terms or max(len(term) for term in terms) < FTS_MIN_PREFIX:
+        return None
+    
+    # Every term must prefix-match a word in one of the indexed columns
+    match = ' AND '.join('"' + term.replace('"', '""') + '"*' for term in terms)
+    phrase = ' '.join(terms)
+    prefix = phrase.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    # Unary + keeps SQLite from driving either query from idx_exchange,
+    # which would run the FTS match once per row of that exchange
+    exchange_filter = f"AND +i.exchange IN ({', '.join('?' * len(exchanges))})" if exchanges else ''
+    
+    # Ranking only sees the first FTS_MAX_CANDIDATES matches, plus the row
+    # whose symbol is exactly the query so a broad term still finds it first.
+    # Then: exact symbol hits, symbol prefix hits, equities ahead of
+    # derivatives (nearest expiry first), bm25 relevance
+    columns = ', '.join('i.' + column.strip() for column in INSTRUMENT_FIELDS.split(','))
+    cursor.execute(f'''
+        WITH candidates AS MATERIALIZED (
+            SELECT f.rowid AS id, f.rank AS rank FROM instruments_fts f
+            JOIN instruments i ON i.id = f.rowid
+            WHERE instruments_fts MATCH ? {exchange_filter}
+            LIMIT ?
+        )
+        SELECT {columns} FROM (
+            SELECT id, rank FROM candidates
+            UNION ALL
+            SELECT i.id, NULL FROM instruments i
+            WHERE i.trading_symbol = ? {exchange_filter}
+              AND i.id NOT IN (SELECT id FROM candidates)
+        ) c
+        JOIN instruments i ON i.id = c.id
+        ORDER BY
+            CASE
+                WHEN UPPER(i.trading_symbol) = ? OR UPPER(i.symbol_name) = ? THEN 0
+                WHEN UPPER(i.trading_symbol) LIKE ? ESCAPE '\\'
+                  OR UPPER(i.symbol_name) LIKE ? ESCAPE '\\' THEN 1
+                ELSE 2
+            END,
+            i.expiry_date IS NOT NULL,
+            i.expiry_date,
+            c.rank
+        LIMIT ?
+    ''', (match, *exchanges, FTS_MAX_CANDIDATES, phrase, *exchanges,
+          phrase, phrase, prefix, prefix, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
+def fetch_instruments_by_ids(cursor, ids):
+    if not ids:
+        return []
+    # Chunk to stay under SQLite's bound-parameter limit
+    rows = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'SELECT {INSTRUMENT_FIELDS} FROM instruments WHERE id IN ({placeholders})', chunk)
+        for row in cursor.fetchall():
+            rows[row['id']] = dict(row)
+    return [rows[i] for i in ids if i in rows]
+
+def bump_instrument_generation(instrument_id=None):
+    # Every write to the instrument master makes cached search results stale;
+    # a single-row write is patched into the search index, anything else rebuilds it.
+    # The index is updated, or marked not ready, before the generation moves, so
+    # a search cached under the new generation never read the old index
+    global instrument_generation
+    if instrument_id is not None:
+        search_index.refresh_row(get_db, instrument_id)
+    else:
+        search_index.rebuild_async(get_db)
+    with generation_lock:
+        instrument_generation += 1
 
 @app.route('/api/instruments/count', methods=['GET'])
 def count_instruments():
@@ -167,6 +516,7 @@ def create_instrument():
         conn.commit()
         instrument_id = cursor.lastrowid
         conn.close()
+        bump_instrument_generation(instrument_id)
         return jsonify({'id': instrument_id, 'message': 'Instrument created'}), 201
     except sqlite3.IntegrityError:
         conn.close()
@@ -183,7 +533,7 @@ def update_instrument(instrument_id):
             security_id = ?, exchange = ?, segment = ?, instrument_name = ?,
             trading_symbol = ?, display_name = ?, lot_size = ?, expiry_date = ?,
             strike_price = ?, option_type = ?, tick_size = ?, expiry_flag = ?,
-            instrument_type = ?, series = ?, symbol_name = ?
+            instrument_type = ?, series = ?, symbol_name = ?, row_hash = NULL
         WHERE id = ?
     ''', (
         data.get('security_id'), data.get('exchange'), data.get('segment'),
@@ -195,6 +545,7 @@ def update_instrument(instrument_id):
     ))
     conn.commit()
     conn.close()
+    bump_instrument_generation(instrument_id)
     return jsonify({'message': 'Instrument updated'})
 
 @app.route('/api/instruments/<int:instrument_id>', methods=['DELETE'])
@@ -204,6 +555,7 @@ def delete_instrument(instrument_id):
     cursor.execute('DELETE FROM instruments WHERE id = ?', (instrument_id,))
     conn.commit()
     conn.close()
+    bump_instrument_generation(instrument_id)
     return jsonify({'message': 'Instrument deleted'})
 
 @app.route('/api/instruments/bulk-delete', methods=['DELETE'])
@@ -214,8 +566,274 @@ def bulk_delete():
     conn.commit()
     count = cursor.rowcount
     conn.close()
+    bump_instrument_generation()
     return jsonify({'message': f'Deleted {count} instruments'})
 
+INSTRUMENT_COLUMNS = '''
+    security_id, exchange, segment, instrument_name,
+    trading_symbol, display_name, lot_size, expiry_date,
+    strike_price, option_type, tick_size, expiry_flag,
+    instrument_type, series, symbol_name, row_hash
+'''
+
+def instrument_row_hash(values):
+    # Normalized field values -> stable digest; a manual edit through the API
+    # clears the stored hash so the next sync re-applies the master's row
+    normalized = '\x1f'.join('' if v is None else str(v).strip() for v in values)
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+def parse_instrument_row(row):
+    # Support both standard and detailed CSV formats
+    security_id = row.get('SEM_SMST_SECURITY_ID') or row.get('SECURITY_ID', '')
+    if not security_id:
+        return None
+    
+    # Get expiry date from either format
+    expiry_date = row.get('SEM_EXPIRY_DATE') or row.get('SM_EXPIRY_DATE', '')
+    if expiry_date and expiry_date != '-0.01000':
+        try:
+            expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
+        except:
+            try:
+                expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+            except:
+                expiry_date = None
+    else:
+        expiry_date = None
+    
+    try:
+        lot_size = float(row.get('SEM_LOT_UNITS') or row.get('LOT_SIZE') or 0)
+        strike_price = float(row.get('SEM_STRIKE_PRICE') or row.get('STRIKE_PRICE') or 0)
+        tick_size = float(row.get('SEM_TICK_SIZE') or row.get('TICK_SIZE') or 0)
+    except:
+        lot_size = strike_price = tick_size = 0
+    
+    # Map fields from either format
+    exchange = row.get('SEM_EXM_EXCH_ID') or row.get('EXCH_ID', '')
+    segment = row.get('SEM_SEGMENT') or row.get('SEGMENT', '')
+    instrument_name = row.get('SEM_INSTRUMENT_NAME') or row.get('INSTRUMENT', '')
+    trading_symbol = row.get('SEM_TRADING_SYMBOL') or row.get('SYMBOL_NAME', '')
+    display_name = row.get('SEM_CUSTOM_SYMBOL') or row.get('DISPLAY_NAME', '')
+    option_type = row.get('SEM_OPTION_TYPE') or row.get('OPTION_TYPE', '')
+    expiry_flag = row.get('SEM_EXPIRY_FLAG') or row.get('EXPIRY_FLAG', '')
+    instrument_type = row.get('SEM_EXCH_INSTRUMENT_TYPE') or row.get('INSTRUMENT_TYPE', '')
+    series = row.get('SEM_SERIES') or row.get('SERIES', '')
+    symbol_name = row.get('SM_SYMBOL_NAME') or row.get('SYMBOL_NAME', '')
+    
+    values = (
+        security_id, exchange, segment, instrument_name,
+        trading_symbol, display_name, lot_size, expiry_date,
+        strike_price, option_type, tick_size, expiry_flag,
+        instrument_type, series, symbol_name
+    )
+    return values + (instrument_row_hash(values),)
+
+def parse_instrument_csv(binary_stream, job):
+    # Decode and parse incrementally; only the current row is held in memory.
+    # A malformed row is counted as failed and skipped, not fatal to the job
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text_stream)
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                job.rows_failed += 1
+                continue
+            job.rows_parsed += 1
+            try:
+                values = parse_instrument_row(row)
+            except Exception:
+                job.rows_failed += 1
+                continue
+            if values is None:
+                job.rows_skipped += 1
+                continue
+            yield values
+    finally:
+        # Otherwise the wrapper closes the caller's binary stream when collected
+        text_stream.detach()
+
+IMPORT_CHUNK_ROWS = 5000
+# Rows applied to the live table per write transaction; each batch holds the
+# write lock for a fraction of busy_timeout, so order writes queue briefly
+# instead of failing with "database is locked"
+IMPORT_APPLY_ROWS = 5000
+# Gap left between batches. SQLite's busy handler polls a locked database
+# every 100 ms at most, so a shorter gap lets the import win every race
+IMPORT_APPLY_PAUSE = 0.1
+# The import is in no hurry: it outwaits busy writers this long per batch
+# rather than failing the job
+IMPORT_LOCK_TIMEOUT = 60
+# A sync that would delete more than this share of the master is refused
+# unless the upload passes confirm_deletes=1
+SYNC_MAX_DELETE_RATIO = 0.5
+import_jobs = ImportJobManager(max_workers=1)
+
+def run_instrument_import(job):
+    # Phase 1: load the CSV into a scratch database. Writes there do not take
+    # the main database's write lock, so orders and settings keep flowing.
+    staging_path = job.path + '.staging.db'
+    conn = get_db()
+    conn.execute('ATTACH DATABASE ? AS staging', (staging_path,))
+    try:
+        conn.execute('PRAGMA staging.journal_mode = OFF')
+        conn.execute('PRAGMA staging.synchronous = OFF')
+        conn.execute('''
+            CREATE TABLE staging.instruments_import (
+                security_id TEXT, exchange TEXT, segment TEXT, instrument_name TEXT,
+                trading_symbol TEXT, display_name TEXT, lot_size REAL, expiry_date TEXT,
+                strike_price REAL, option_type TEXT, tick_size REAL, expiry_flag TEXT,
+                instrument_type TEXT, series TEXT, symbol_name TEXT, row_hash TEXT
+            )
+        ''')
+        with open(job.path, 'rb') as binary_stream:
+            rows = parse_instrument_csv(binary_stream, job)
+            while True:
+                chunk = list(itertools.islice(rows, IMPORT_CHUNK_ROWS))
+                job.bytes_read = binary_stream.tell()
+                if not chunk:
+                    break
+                conn.executemany(
+                    'INSERT INTO staging.instruments_import VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    chunk
+                )
+                job.rows_staged += len(chunk)
+        conn.commit()
+        
+        # Phase 2: work out the difference against the live table. This only
+        # reads the main database, so it takes no write lock however long it runs
+        job.status = 'swapping'
+        plan_staged_instruments(conn, job)
+        
+        # Phase 3: apply the plan in short write transactions. Readers see the
+        # master move batch by batch; a job that fails part way leaves earlier
+        # batches applied, and uploading the file again finishes the diff.
+        apply_staged_instruments(conn, job)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute('DETACH DATABASE staging')
+        conn.close()
+        for path in (staging_path, job.path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        # Batches applied before a failure changed the master too
+        if job.status == 'swapping':
+            bump_instrument_generation()
+    
+    print(f"Import {job.id} complete: staged={job.rows_staged}, skipped={job.rows_skipped}, "
+          f"failed={job.rows_failed}, summary={job.summary}")
+
+def plan_staged_instruments(conn, job):
+    # Both modes upsert the staged rows; only a sync deletes the rest. Unchanged
+    # rows are never written, so ids stay stable and the FTS triggers only see
+    # the rows that actually changed.
+    # A security id listed twice keeps its last row
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX staging.idx_import_security_id ON instruments_import(security_id)')
+    cursor.execute('''
+        DELETE FROM staging.instruments_import WHERE rowid NOT IN (
+            SELECT MAX(rowid) FROM staging.instruments_import GROUP BY security_id
+        )
+    ''')
+    cursor.execute('SELECT COUNT(*) FROM staging.instruments_import')
+    staged = cursor.fetchone()[0]
+    job.summary = {'added': 0, 'updated': 0, 'deleted': 0, 'unchanged': staged}
+    
+    # Ids of live rows missing from the file, in id order for the delete batches
+    cursor.execute('CREATE TABLE staging.instruments_delete (id INTEGER)')
+    if job.mode == 'sync':
+        # An empty file or unrecognized headers stage nothing, and a sync would
+        # then wipe the master; raising fails the job before anything is written
+        if not staged:
+            raise ValueError('No instrument rows found in the file; sync aborted, master left unchanged')
+        cursor.execute('''
+            INSERT INTO staging.instruments_delete
+            SELECT id FROM main.instruments WHERE NOT EXISTS (
+                SELECT 1 FROM staging.instruments_import s
+                WHERE s.security_id = main.instruments.security_id
+            )
+            ORDER BY id
+        ''')
+        to_delete = cursor.rowcount
+        cursor.execute('SELECT COUNT(*) FROM main.instruments')
+        existing = cursor.fetchone()[0]
+        if existing and to_delete > existing * SYNC_MAX_DELETE_RATIO and not job.confirm_deletes:
+            raise ValueError(
+                f'Sync would delete {to_delete} of {existing} instruments; '
+                f'upload again with confirm_deletes=1 to apply it'
+            )
+    conn.commit()
+
+def staged_batches(cursor, table):
+    # rowid ranges covering a staging table, IMPORT_APPLY_ROWS wide
+    cursor.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM staging.{table}')
+    last = cursor.fetchone()[0]
+    return [(start, start + IMPORT_APPLY_ROWS) for start in range(0, last, IMPORT_APPLY_ROWS)]
+
+def begin_apply_batch(cursor):
+    deadline = time.time() + IMPORT_LOCK_TIMEOUT
+    while True:
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) or time.time() > deadline:
+                raise
+            time.sleep(IMPORT_APPLY_PAUSE)
+
+def apply_staged_instruments(conn, job):
+    summary = job.summary
+    cursor = conn.cursor()
+    for low, high in staged_batches(cursor, 'instruments_delete'):
+        begin_apply_batch(cursor)
+        cursor.execute('''
+            DELETE FROM main.instruments WHERE id IN (
+                SELECT id FROM staging.instruments_delete WHERE rowid > ? AND rowid <= ?
+            )
+        ''', (low, high))
+        summary['deleted'] += cursor.rowcount
+        conn.commit()
+        time.sleep(IMPORT_APPLY_PAUSE)
+    
+    for low, high in staged_batches(cursor, 'instruments_import'):
+        begin_apply_batch(cursor)
+        cursor.execute('''
+            UPDATE main.instruments SET
+                exchange = s.exchange, segment = s.segment, instrument_name = s.instrument_name,
+                trading_symbol = s.trading_symbol, display_name = s.display_name,
+                lot_size = s.lot_size, expiry_date = s.expiry_date,
+                strike_price = s.strike_price, option_type = s.option_type,
+                tick_size = s.tick_size, expiry_flag = s.expiry_flag,
+                instrument_type = s.instrument_type, series = s.series,
+                symbol_name = s.symbol_name, row_hash = s.row_hash
+            FROM staging.instruments_import s
+            WHERE s.rowid > ? AND s.rowid <= ?
+              AND s.security_id = main.instruments.security_id
+              AND main.instruments.row_hash IS NOT s.row_hash
+        ''', (low, high))
+        updated = cursor.rowcount
+        cursor.execute(f'''
+            INSERT INTO main.instruments ({INSTRUMENT_COLUMNS})
+            SELECT * FROM staging.instruments_import s
+            WHERE s.rowid > ? AND s.rowid <= ? AND NOT EXISTS (
+                SELECT 1 FROM main.instruments i WHERE i.security_id = s.security_id
+            )
+            ORDER BY s.rowid
+        ''', (low, high))
+        added = cursor.rowcount
+        conn.commit()
+        summary['updated'] += updated
+        summary['added'] += added
+        summary['unchanged'] -= updated + added
+        time.sleep(IMPORT_APPLY_PAUSE)
+
 @app.route('/api/instruments/upload', methods=['POST'])
 def upload_csv():
     if 'file' not in request.files:
@@ -225,111 +843,38 @@ def upload_csv():
     if file.filename == '' or not file.filename.endswith('.csv'):
         return jsonify({'error': 'Invalid file'}), 400
     
+    # Spool to disk (streamed in chunks) so the worker can read it after
+    # this request has returned
+    fd, path = tempfile.mkstemp(prefix='instruments-', suffix='.csv')
+    os.close(fd)
     try:
-        stream = io.StringIO(file.stream.read().decode('UTF8'), newline=None)
-        csv_reader = csv.DictReader(stream)
-        conn = get_db()
-        cursor = conn.cursor()
-        inserted = 0
-        updated = 0
-        errors = 0
-        batch_size = 1000
-        batch_count = 0
-        
-        # Use INSERT OR REPLACE for better performance
-        insert_query = '''
-            INSERT OR REPLACE INTO instruments (
-                security_id, exchange, segment, instrument_name,
-                trading_symbol, display_name, lot_size, expiry_date,
-                strike_price, option_type, tick_size, expiry_flag,
-                instrument_type, series, symbol_name
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        '''
-        
-        batch_data = []
-        for row in csv_reader:
-            # Support both standard and detailed CSV formats
-            security_id = row.get('SEM_SMST_SECURITY_ID') or row.get('SECURITY_ID', '')
-            if not security_id:
-                continue
-            
-            # Get expiry date from either format
-            expiry_date = row.get('SEM_EXPIRY_DATE') or row.get('SM_EXPIRY_DATE', '')
-            if expiry_date and expiry_date != '-0.01000':
-                try:
-                    expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d %H:%M:%S').strftime('%Y-%m-%d')
-                except:
-                    try:
-                        expiry_date = datetime.strptime(expiry_date, '%Y-%m-%d').strftime('%Y-%m-%d')
-                    except:
-                        expiry_date = None
-            else:
-                expiry_date = None
-            
-            try:
-                lot_size = float(row.get('SEM_LOT_UNITS') or row.get('LOT_SIZE') or 0)
-                strike_price = float(row.get('SEM_STRIKE_PRICE') or row.get('STRIKE_PRICE') or 0)
-                tick_size = float(row.get('SEM_TICK_SIZE') or row.get('TICK_SIZE') or 0)
-            except:
-                lot_size = strike_price = tick_size = 0
-            
-            # Map fields from either format
-            exchange = row.get('SEM_EXM_EXCH_ID') or row.get('EXCH_ID', '')
-            segment = row.get('SEM_SEGMENT') or row.get('SEGMENT', '')
-            instrument_name = row.get('SEM_INSTRUMENT_NAME') or row.get('INSTRUMENT', '')
-            trading_symbol = row.get('SEM_TRADING_SYMBOL') or row.get('SYMBOL_NAME', '')
-            display_name = row.get('SEM_CUSTOM_SYMBOL') or row.get('DISPLAY_NAME', '')
-            option_type = row.get('SEM_OPTION_TYPE') or row.get('OPTION_TYPE', '')
-            expiry_flag = row.get('SEM_EXPIRY_FLAG') or row.get('EXPIRY_FLAG', '')
-            instrument_type = row.get('SEM_EXCH_INSTRUMENT_TYPE') or row.get('INSTRUMENT_TYPE', '')
-            series = row.get('SEM_SERIES') or row.get('SERIES', '')
-            symbol_name = row.get('SM_SYMBOL_NAME') or row.get('SYMBOL_NAME', '')
-            
-            batch_data.append((
-                security_id, exchange, segment, instrument_name,
-                trading_symbol, display_name, lot_size, expiry_date,
-                strike_price, option_type, tick_size, expiry_flag,
-                instrument_type, series, symbol_name
-            ))
-            
-            # Process in batches for better performance
-            if len(batch_data) >= batch_size:
-                try:
-                    print(f"Attempting to insert batch {batch_count + 1} with {len(batch_data)} records")
-                    print(f"Sample record: {batch_data[0] if batch_data else 'empty'}")
-                    cursor.executemany(insert_query, batch_data)
-                    conn.commit()
-                    inserted += len(batch_data)
-                    batch_count += 1
-                    print(f"✅ Processed batch {batch_count}: {inserted} total records")
-                except Exception as e:
-                    errors += len(batch_data)
-                    print(f"❌ Error processing batch: {e}")
-                    print(f"First record in failed batch: {batch_data[0] if batch_data else 'empty'}")
-                batch_data = []
-        
-        # Process remaining records
-        if batch_data:
-            try:
-                print(f"Processing final batch with {len(batch_data)} records")
-                print(f"Sample record: {batch_data[0] if batch_data else 'empty'}")
-                cursor.executemany(insert_query, batch_data)
-                conn.commit()
-                inserted += len(batch_data)
-                print(f"✅ Processed final batch: {len(batch_data)} records, total: {inserted}")
-            except Exception as e:
-                errors += len(batch_data)
-                print(f"❌ Error processing final batch: {e}")
-                print(f"First record in failed batch: {batch_data[0] if batch_data else 'empty'}")
-        else:
-            print("No remaining records to process")
-        
-        conn.close()
-        print(f"Upload complete: inserted={inserted}, updated={updated}, errors={errors}")
-        return jsonify({'message': 'CSV uploaded', 'inserted': inserted, 'updated': updated, 'errors': errors})
+        file.save(path)
     except Exception as e:
-        print(f"Upload failed: {e}")
+        os.remove(path)
         return jsonify({'error': str(e)}), 500
+    
+    # mode=sync also deletes live rows missing from the file; the default
+    # replace mode only adds and updates
+    mode = request.args.get('mode', 'replace')
+    if mode not in ('replace', 'sync'):
+        os.remove(path)
+        return jsonify({'error': 'mode must be replace or sync'}), 400
+    confirm_deletes = request.args.get('confirm_deletes', '0').lower() in ('1', 'true', 'yes')
+    
+    job = ImportJob(file.filename, path, os.path.getsize(path), mode, confirm_deletes)
+    import_jobs.submit(job, run_instrument_import)
+    return jsonify({
+        'message': 'CSV upload queued',
+        'job_id': job.id,
+        'status_url': f'/api/instruments/jobs/{job.id}'
+    }), 202
+
+@app.route('/api/instruments/jobs/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
 
 # Watchlist endpoints
 @app.route('/api/watchlist', methods=['GET'])
@@ -412,20 +957,76 @@ def save_settings():
     conn.close()
     return jsonify({'message': 'Settings saved'})
 
-# Simple in-memory cache for API responses
-from datetime import datetime, timedelta
-import threading
-
-price_cache = {}
-cache_lock = threading.Lock()
+# Per-instrument last prices, each entry fresh for CACHE_DURATION
 CACHE_DURATION = 2  # Cache for 2 seconds
+LTP_CACHE_SIZE = 50000  # instruments
+ltp_store = LtpStore(max_age=CACHE_DURATION, max_size=LTP_CACHE_SIZE)
+
+# Live ticks published by websocket_server.py through shared memory
+feed_prices = LastValueReader()
 
 # Create a session for connection pooling
 import requests
 api_session = requests.Session()
 
-# Market data proxy endpoint
-@app.route('/api/market/ltp', methods=['POST'])
+# Every DhanHQ REST call takes a token from its account's endpoint category
+# first; calls that would queue longer than RATE_LIMIT_MAX_WAIT get a 429 instead
+RATE_LIMIT_MAX_WAIT = 3  # seconds
+rate_limiters = AccountRateLimiters(max_wait=RATE_LIMIT_MAX_WAIT)
+
+def fetch_ltp_upstream(keys, credentials):
+    """LTPs for `keys`, split into DhanHQ-sized requests
+
+    The batcher has already reserved the first request's quote slot; any
+    further chunks wait for their own.
+    """
+    access_token, client_id = credentials
+    prices = {}
+    for start in range(0, len(keys), QUOTE_MAX_INSTRUMENTS):
+        if start:
+            try:
+                rate_limiters.acquire(client_id, 'quote')
+            except RateLimitExceeded as e:
+                raise UpstreamError(429, {'error': str(e)})
+        try:
+            response = api_session.post(
+                'https://api.dhan.co/v2/marketfeed/ltp',
+                json=build_ltp_request(keys[start:start + QUOTE_MAX_INSTRUMENTS]),
+                headers={
+                    'access-token': access_token,
+                    'client-id': client_id,
+                    'Content-Type': 'application/json'
+                },
+                timeout=3  # Reduced from 10s to 3s
+            )
+        except requests.Timeout:
+            raise UpstreamError(504, {'error': 'DhanHQ API timeout'})
+        if response.status_code != 200:
+            raise UpstreamError(response.status_code, response.json())
+        prices.update(split_ltp_response(response.json()))
+    return prices
+
+# Change sequence per instrument for conditional and delta polling
+price_versions = PriceVersions(max_size=LTP_CACHE_SIZE)
+
+def ltp_etag(keys, seq):
+    """Validator for a poll: the instrument set plus the newest change in it
+
+    `seq` is a price_versions token, so validators from before a restart
+    or from another worker never match.
+    """
+    keyset = '|'.join(sorted(f'{segment}:{security_id}' for segment, security_id in set(keys)))
+    return f'"{hashlib.blake2b(keyset.encode(), digest_size=8).hexdigest()}-{seq}"'
+
+# Concurrent cache misses share one upstream call per batch window; while
+# a batch waits for its quote slot it keeps collecting instruments
+ltp_batcher = LtpBatcher(fetch_ltp_upstream, window=0.01,
+                         timeout=RATE_LIMIT_MAX_WAIT + 5,
+                         reserve=lambda credentials: rate_limiters.reserve(credentials[1], 'quote'))
+
+# Market data proxy endpoint; GET /api/market/ltp?instruments=NSE_EQ:11536,...
+# is the conditional form that answers 304, POST takes DhanHQ's body shape
+@app.route('/api/market/ltp', methods=['GET', 'POST'])
 def get_market_ltp():
     user_token = request.headers.get('X-User-Token', 'default_user')
     
@@ -442,46 +1043,154 @@ def get_market_ltp():
     access_token = result['access_token']
     client_id = result['client_id']
     
-    # Create cache key from request data
-    cache_key = f"{user_token}:{str(request.json)}"
+    try:
+        if request.method == 'GET':
+            requested = parse_ltp_query(request.args.get('instruments'))
+        else:
+            requested = parse_ltp_request(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not requested:
+        return jsonify({'error': 'No instruments requested'}), 400
+    # A token from another boot or worker resolves to None: full response
+    since = price_versions.resolve(request.args.get('since'))
+    
+    # Instruments on the live WebSocket feed are answered from shared memory
+    prices = feed_prices.lookup(requested)
+    keys = [key for key in requested if key not in prices]
+    
+    # Answer from fresh per-instrument entries; only the stale subset goes
+    # upstream, merged with any concurrent requests for the same instruments
+    cached, stale = ltp_store.lookup(keys)
+    prices.update(cached)
+    if stale:
+        try:
+            fetched = ltp_batcher.get(stale, (access_token, client_id))
+        except UpstreamError as e:
+            if e.status_code == 429:
+                return jsonify(e.body), 429, {'Retry-After': '1'}
+            return jsonify(e.body), e.status_code
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+        ltp_store.update(fetched)
+        prices.update(fetched)
+    
+    # GET pollers that send back the last ETag get 304 while nothing moved;
+    # with ?since=<seq> only instruments changed after that seq are encoded
+    seqs = price_versions.observe(prices)
+    latest = price_versions.token(max(seqs.values(), default=0))
+    etag = ltp_etag(requested, latest)
+    conditional = request.method == 'GET'
+    if conditional and request.if_none_match.contains_weak(etag.strip('"')):
+        return Response(status=304, headers={'ETag': etag})
+    if since is not None:
+        prices = {key: payload for key, payload in prices.items() if seqs[key] > since}
+        if not prices and conditional:
+            return Response(status=304, headers={'ETag': etag})
+    
+    body = build_ltp_response(prices)
+    body['seq'] = latest
+    response = jsonify(body)
+    response.headers['ETag'] = etag
+    return response, 200
+
+# Server-Sent Events price streams: a client registers its instruments once
+# and holds one connection instead of polling /api/market/ltp
+SSE_POLL_INTERVAL = 0.25  # seconds between shared-memory reads
+SSE_FALLBACK_INTERVAL = CACHE_DURATION * 2  # REST refresh for instruments off the feed
+SSE_KEEPALIVE = 15  # seconds of silence before a comment line is sent
+price_streams = PriceStreamRegistry()
+
+@app.route('/api/market/streams', methods=['POST'])
+def create_price_stream():
+    user_token = request.headers.get('X-User-Token', 'default_user')
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT access_token, client_id FROM user_settings WHERE user_token = ?', (user_token,))
+    result = cursor.fetchone()
+    conn.close()
     
-    # Check cache
-    with cache_lock:
-        if cache_key in price_cache:
-            cached_data, cached_time = price_cache[cache_key]
-            if datetime.now() - cached_time < timedelta(seconds=CACHE_DURATION):
-                return jsonify(cached_data), 200
+    if not result or not result['access_token']:
+        return jsonify({'error': 'DhanHQ credentials not configured'}), 401
     
-    # Forward request to DhanHQ API with optimized timeout
     try:
-        response = api_session.post(
-            'https://api.dhan.co/v2/marketfeed/ltp',
-            json=request.json,
-            headers={
-                'access-token': access_token,
-                'client-id': client_id,
-                'Content-Type': 'application/json'
-            },
-            timeout=3  # Reduced from 10s to 3s
-        )
-        
-        if response.status_code == 200:
-            result_data = response.json()
-            # Cache the successful response
-            with cache_lock:
-                price_cache[cache_key] = (result_data, datetime.now())
-                # Clean old cache entries (keep only last 100)
-                if len(price_cache) > 100:
-                    oldest_key = min(price_cache.keys(), key=lambda k: price_cache[k][1])
-                    del price_cache[oldest_key]
-            return jsonify(result_data), 200
-        else:
-            return jsonify(response.json()), response.status_code
-            
-    except requests.Timeout:
-        return jsonify({'error': 'DhanHQ API timeout'}), 504
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        keys = list(dict.fromkeys(parse_ltp_request(request.json)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not keys:
+        return jsonify({'error': 'No instruments requested'}), 400
+    
+    stream = price_streams.register(keys, (result['access_token'], result['client_id']))
+    return jsonify({
+        'stream_id': stream.id,
+        'stream_url': f'/api/market/streams/{stream.id}',
+        'instruments': len(keys)
+    }), 201
+
+@app.route('/api/market/streams/<stream_id>', methods=['GET'])
+def get_price_stream(stream_id):
+    stream = price_streams.get(stream_id)
+    if stream is None:
+        return jsonify({'error': 'Stream not found'}), 404
+    
+    def generate_events():
+        # Prices come from the WebSocket server's shared-memory table; only
+        # instruments whose payload changed since the last event are sent.
+        # Instruments the feed does not carry are refreshed through the
+        # shared LTP store and batcher at the REST cadence.
+        price_streams.opened()
+        sent = {}
+        fallback = {}
+        next_fallback = 0
+        last_write = time.monotonic()
+        seq = 0
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                prices = feed_prices.lookup(stream.keys)
+                now = time.monotonic()
+                if now >= next_fallback:
+                    next_fallback = now + SSE_FALLBACK_INTERVAL
+                    missing = [key for key in stream.keys if key not in prices]
+                    fallback, stale = ltp_store.lookup(missing)
+                    if stale:
+                        try:
+                            fetched = ltp_batcher.get(stale, stream.credentials)
+                            ltp_store.update(fetched)
+                            fallback.update(fetched)
+                        except UpstreamError as e:
+                            yield format_sse('upstream_error', e.body)
+                for key, payload in fallback.items():
+                    prices.setdefault(key, payload)
+                
+                changed = {key: payload for key, payload in prices.items() if sent.get(key) != payload}
+                if changed:
+                    sent.update(changed)
+                    seq += 1
+                    price_streams.sent()
+                    last_write = now
+                    yield format_sse('prices', build_ltp_response(changed), seq)
+                elif now - last_write >= SSE_KEEPALIVE:
+                    yield ': keepalive\n\n'
+                    last_write = now
+                time.sleep(SSE_POLL_INTERVAL)
+        finally:
+            price_streams.closed()
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(generate_events(), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/market/stats', methods=['GET'])
+def get_market_stats():
+    return jsonify({
+        'feed': feed_prices.stats(),
+        'ltp_store': ltp_store.stats(),
+        'price_versions': price_versions.stats(),
+        'ltp_batcher': ltp_batcher.stats(),
+        'rate_limiter': rate_limiters.stats(),
+        'price_streams': price_streams.stats()
+    })
 
 # ============================================
 # PAPER TRADING API ENDPOINTS
@@ -781,5 +1490,6 @@ def get_orders():
 
 if __name__ == '__main__':
     init_db()
+    search_index.rebuild_async(get_db)
     app.run(host='0.0.0.0', port=5000)
 
@@ -9,140 +9,246 @@ import json
 import struct
 import time
 from datetime import datetime
-from typing import Dict, Set, List
+from typing import Callable, Dict, Set, List, Optional, Tuple
 import logging
 
+from client_protocol import FORMATS, TICK_RECORD, encode_tick
+from client_session import ClientSession
+from fanout import IngestSubscriber
+from feed_connections import ConsistentHashRing, FeedConnection
+from feed_decoder import decode_frame, TICKER, QUOTE, OI, PREV_CLOSE, MARKET_STATUS, FULL, DISCONNECT
+from last_value_table import LastValueTable, EXCHANGE_SEGMENT_CODES, EXCHANGE_SEGMENT_NAMES
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+InstrumentKey = Tuple[int, int]  # (numeric exchange segment, security_id)
+
+# Longest micro-batch window a client may ask for
+MAX_BATCH_MS = 1000
+
+# Raw frames waiting for the dispatch stage; receive tasks block when it is full
+FRAME_QUEUE_SIZE = 10000
+
+
+def instrument_key(exchange_segment, security_id) -> InstrumentKey:
+    """Normalize a client or DhanHQ instrument reference to the binary header's form
+
+    Clients send segments by name ("NSE_EQ") while tick headers carry the
+    numeric code; both, as well as numeric strings, map to the same key.
+    Raises ValueError for unknown segments or non-numeric security ids.
+    """
+    if isinstance(exchange_segment, str) and not exchange_segment.isdigit():
+        if exchange_segment not in EXCHANGE_SEGMENT_CODES:
+            raise ValueError(f"Unknown exchange segment: {exchange_segment}")
+        code = EXCHANGE_SEGMENT_CODES[exchange_segment]
+    else:
+        code = int(exchange_segment)
+        if code not in EXCHANGE_SEGMENT_NAMES:
+            raise ValueError(f"Unknown exchange segment: {exchange_segment}")
+    return code, int(security_id)
+
 
 class DhanHQWebSocketManager:
     """Manages WebSocket connection to DhanHQ and price distribution to clients"""
     
-    def __init__(self, access_token: str, client_id: str):
+    def __init__(self, access_token: str, client_id: str, last_values: Optional[LastValueTable] = None,
+                 client_queue_size: int = 1000, slow_client_policy: str = 'drop_oldest',
+                 default_max_rate: Optional[float] = None, default_batch_ms: float = 0,
+                 max_frame_bytes: int = 64 * 1024, feed_connections: int = 1,
+                 ingest_path: Optional[str] = None):
         self.access_token = access_token
         self.client_id = client_id
-        self.dhan_ws = None
-        self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.subscriptions: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
-        self.subscribed_instruments: Set[tuple] = set()  # (exchange_segment, security_id)
+        self.last_values = last_values  # shared with the Flask process for /api/market/ltp
+        # Upstream sockets, each with its own receive task; instruments are
+        # spread over them by consistent hashing and all frames meet in one queue
+        url = f"wss://api-feed.dhan.co?version=2&token={access_token}&clientId={client_id}&authType=2"
+        self.frames: asyncio.Queue = asyncio.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.connections = [FeedConnection(index, url, self.frames, self.rebalance)
+                            for index in range(feed_connections)]
+        self.ring = ConsistentHashRing(self.connections)
+        self.assignment_lock = asyncio.Lock()
+        self.dispatch_task = None
+        # A fan-out worker has no DhanHQ sockets of its own: it takes frames
+        # from the ingest process and asks it for instruments instead
+        self.ingest = (IngestSubscriber(self.frames, lambda: self.subscribed_instruments, ingest_path)
+                       if ingest_path else None)
+        # Called with every raw frame before it is decoded; the ingest process
+        # publishes to its workers through this
+        self.frame_listeners: List[Callable] = []
+        # Each client gets a bounded send queue drained by its own writer task,
+        # so one slow socket never stalls the tick loop or other clients
+        self.clients: Dict[websockets.WebSocketServerProtocol, ClientSession] = {}
+        self.client_queue_size = client_queue_size
+        self.slow_client_policy = slow_client_policy
+        self.default_max_rate = default_max_rate  # per-instrument updates/s for new clients
+        self.default_batch_ms = default_batch_ms  # micro-batch window for new clients; 0 is off
+        self.max_frame_bytes = max_frame_bytes
+        self.closed_totals = {'sent': 0, 'frames': 0, 'dropped': 0, 'conflated': 0, 'rate_limited': 0,
+                              'slow_disconnects': 0}
+        # Ticks are routed through this index, so each goes only to its subscribers
+        self.subscriptions: Dict[InstrumentKey, Set[websockets.WebSocketServerProtocol]] = {}
+        self.client_subscriptions: Dict[websockets.WebSocketServerProtocol, Set[InstrumentKey]] = {}
+        self.subscribed_instruments: Set[InstrumentKey] = set()
+        self.prev_close: Dict[InstrumentKey, float] = {}  # from prev-close packets, for change %
         self.running = False
         self.heartbeat_task = None
-        self.reconnect_attempts = 0
-        self.max_reconnect_attempts = 50
         
-    async def connect_to_dhan(self):
-        """Establish WebSocket connection to DhanHQ"""
-        try:
-            logger.info("[DhanHQ] Connecting to DhanHQ WebSocket...")
-            
-            # DhanHQ WebSocket URL with query parameters
-            url = f"wss://api-feed.dhan.co?version=2&token={self.access_token}&clientId={self.client_id}&authType=2"
-            
-            self.dhan_ws = await websockets.connect(url)
-            logger.info("[DhanHQ] Connected successfully!")
-            
-            self.reconnect_attempts = 0
-            return True
-            
-        except Exception as e:
-            logger.error(f"[DhanHQ] Connection failed: {e}")
-            return False
+    @property
+    def feed_connected(self) -> bool:
+        if self.ingest:
+            return self.ingest.connected
+        return any(conn.connected for conn in self.connections)
     
-    async def subscribe_to_instruments(self, instruments: List[Dict]):
-        """Subscribe to instruments on DhanHQ WebSocket"""
-        if not self.dhan_ws:
-            logger.error("[DhanHQ] Not connected, cannot subscribe")
-            return False
-        
-        try:
-            # Prepare subscription request
-            subscription_request = {
-                "RequestCode": 15,  # Ticker mode
-                "InstrumentCount": len(instruments),
-                "InstrumentList": instruments
-            }
-            
-            logger.info(f"[DhanHQ] Subscribing to {len(instruments)} instruments")
-            logger.debug(f"[DhanHQ] Subscription request: {subscription_request}")
-            
-            # Send subscription request
-            await self.dhan_ws.send(json.dumps(subscription_request))
-            
-            # Update subscribed instruments
-            for inst in instruments:
-                key = (inst['ExchangeSegment'], str(inst['SecurityId']))
-                self.subscribed_instruments.add(key)
-            
-            logger.info(f"[DhanHQ] Subscription sent for {len(instruments)} instruments")
-            return True
-            
-        except Exception as e:
-            logger.error(f"[DhanHQ] Subscription failed: {e}")
-            return False
+    async def subscribe_to_instruments(self, keys: List[InstrumentKey]):
+        """Subscribe to instruments on DhanHQ, each on the connection the hash ring picks
+
+        They are recorded even when the feed is down, so the next reconnect
+        subscribes them.
+        """
+        self.subscribed_instruments.update(keys)
+        logger.info(f"[DhanHQ] Subscribing to {len(keys)} instruments")
+        if self.ingest:
+            await self.ingest.subscribe(keys)
+            return
+        async with self.assignment_lock:
+            assigned: Dict[FeedConnection, List[InstrumentKey]] = {}
+            for key in keys:
+                assigned.setdefault(self.ring.node_for(key), []).append(key)
+            for conn, conn_keys in assigned.items():
+                await conn.subscribe(conn_keys)
     
-    async def handle_dhan_messages(self):
-        """Receive and process messages from DhanHQ"""
-        try:
-            while self.running and self.dhan_ws:
-                try:
-                    message = await asyncio.wait_for(self.dhan_ws.recv(), timeout=60)
-                    
-                    # Check if binary (ticker data) or text (status message)
-                    if isinstance(message, bytes):
-                        await self.process_ticker_data(message)
-                    else:
-                        await self.process_text_message(message)
-                        
-                except asyncio.TimeoutError:
-                    logger.warning("[DhanHQ] No message received for 60s, connection may be stale")
-                    continue
-                except websockets.exceptions.ConnectionClosed:
-                    logger.error("[DhanHQ] Connection closed by server")
-                    break
-                    
-        except Exception as e:
-            logger.error(f"[DhanHQ] Message handling error: {e}")
-        finally:
-            await self.reconnect_to_dhan()
+    async def unsubscribe_from_instruments(self, keys: List[InstrumentKey]):
+        """Drop instruments no client follows any more, upstream and in shared memory"""
+        self.subscribed_instruments.difference_update(keys)
+        for segment, security_id in keys:
+            self.prev_close.pop((segment, security_id), None)
+            if self.last_values:
+                self.last_values.deactivate(segment, security_id)
+        logger.info(f"[DhanHQ] Unsubscribing from {len(keys)} instruments")
+        if self.ingest:
+            await self.ingest.unsubscribe(keys)
+            return
+        async with self.assignment_lock:
+            for conn in self.connections:
+                owned = [key for key in keys if key in conn.instruments]
+                if owned:
+                    await conn.unsubscribe(owned)
+    
+    async def rebalance(self, changed: Optional[FeedConnection] = None):
+        """Re-hash instruments over the live connections after one connects or drops
+
+        Only instruments whose owner changed move: the new owner subscribes
+        before the old one unsubscribes, so they are never left uncovered.
+        With no live connection, assignments stay put until one comes back.
+        """
+        async with self.assignment_lock:
+            live = [conn for conn in self.connections if conn.connected]
+            if changed is not None:
+                state = 'up' if changed.connected else 'down'
+                logger.info(f"[DhanHQ] Connection {changed.index} {state}, {len(live)}/{len(self.connections)} live")
+            if not live:
+                return
+            self.ring = ConsistentHashRing(live)
+            desired: Dict[FeedConnection, Set[InstrumentKey]] = {conn: set() for conn in self.connections}
+            for key in self.subscribed_instruments:
+                desired[self.ring.node_for(key)].add(key)
+            for conn in self.connections:
+                added = desired[conn] - conn.instruments
+                if added:
+                    await conn.subscribe(sorted(added))
+            for conn in self.connections:
+                removed = conn.instruments - desired[conn]
+                if removed:
+                    await conn.unsubscribe(sorted(removed))
+    
+    async def dispatch_frames(self):
+        """The common stage every connection's receive task feeds"""
+        while self.running:
+            message = await self.frames.get()
+            try:
+                for listener in self.frame_listeners:
+                    listener(message)
+                # Check if binary (ticker data) or text (status message)
+                if isinstance(message, bytes):
+                    await self.process_ticker_data(message)
+                else:
+                    await self.process_text_message(message)
+            except Exception as e:
+                logger.error(f"[DhanHQ] Message handling error: {e}")
     
     async def process_ticker_data(self, data: bytes):
-        """Parse binary ticker data from DhanHQ"""
+        """Decode a binary DhanHQ frame and route each packet in it"""
         try:
-            # DhanHQ ticker packet format (17 bytes):
-            # Response Header (8 bytes) + LTP (4 bytes float32) + LTT (4 bytes int32) + padding (1 byte)
-            
-            if len(data) < 17:
-                logger.warning(f"[DhanHQ] Invalid ticker packet size: {len(data)}")
-                return
-            
-            # Parse response header (8 bytes)
-            response_code = struct.unpack('B', data[0:1])[0]  # Should be 2 for ticker
-            message_length = struct.unpack('<H', data[1:3])[0]
-            exchange_segment = struct.unpack('B', data[3:4])[0]
-            security_id = struct.unpack('<I', data[4:8])[0]
-            
-            # Parse ticker data
-            ltp = struct.unpack('<f', data[8:12])[0]  # float32
-            ltt = struct.unpack('<I', data[12:16])[0]  # int32
-            
-            # Create ticker object
-            ticker = {
-                'type': 'ticker',
-                'exchangeSegment': exchange_segment,
-                'securityId': str(security_id),
-                'ltp': round(ltp, 2),
-                'ltt': ltt,
-                'timestamp': int(time.time() * 1000)
-            }
-            
-            logger.debug(f"[DhanHQ] Ticker: {ticker['securityId']} = ₹{ticker['ltp']}")
+            packets = decode_frame(data)
+        except struct.error as e:
+            logger.error(f"[DhanHQ] Feed decoding error: {e}")
+            return
+        
+        timestamp = int(time.time() * 1000)
+        for packet in packets:
+            try:
+                await self.process_packet(packet, timestamp)
+            except Exception as e:
+                logger.error(f"[DhanHQ] Packet handling error: {e}")
+    
+    async def process_packet(self, packet: tuple, timestamp: int):
+        """Publish one decoded packet to the last-value table and subscribers"""
+        code = packet.code
+        key = (packet.segment, packet.security_id)
+        if code in (TICKER, QUOTE, FULL) and self.last_values:
+            self.last_values.update(packet.segment, packet.security_id, packet.ltp, packet.ltt)
+        if code == PREV_CLOSE:
+            self.prev_close[key] = packet.prev_close
+        if key not in self.subscriptions and code not in (DISCONNECT, MARKET_STATUS):
+            return  # nobody to encode for
+        
+        # The segment goes out by name, as clients subscribe
+        instrument = {
+            'exchangeSegment': EXCHANGE_SEGMENT_NAMES.get(packet.segment, packet.segment),
+            'securityId': str(packet.security_id)
+        }
+        
+        if code in (TICKER, QUOTE, FULL):
+            ltp = round(packet.ltp, 2)
+            ticker = {'type': 'ticker', **instrument, 'ltp': ltp, 'ltt': packet.ltt, 'timestamp': timestamp}
+            record = [packet.segment, packet.security_id, packet.ltp, packet.ltt]
+            prev_close = self.prev_close.get(key)
+            if prev_close:
+                ticker['change'] = round(ltp - prev_close, 2)
+                ticker['change_percent'] = round((ltp - prev_close) / prev_close * 100, 2)
+                record += [ticker['change'], ticker['change_percent']]
+            if code != TICKER:
+                ticker.update({
+                    'volume': packet.volume,
+                    'open': round(packet.open, 2),
+                    'high': round(packet.high, 2),
+                    'low': round(packet.low, 2),
+                    'close': round(packet.close, 2)
+                })
+            if code == FULL:
+                ticker['oi'] = packet.oi
             
-            # Broadcast to subscribed clients
-            await self.broadcast_to_clients(ticker)
+            logger.debug(f"[DhanHQ] Ticker: {ticker['securityId']} = ₹{ltp}")
             
-        except Exception as e:
-            logger.error(f"[DhanHQ] Ticker parsing error: {e}")
+            # Send to subscribed clients only
+            await self.send_to_subscribers(key, ticker, record)
+        
+        elif code == PREV_CLOSE:
+            await self.send_to_subscribers(key, {
+                'type': 'prev_close', **instrument,
+                'prevClose': round(packet.prev_close, 2), 'prevOi': packet.prev_oi
+            }, replaceable=False)
+        
+        elif code == OI:
+            await self.send_to_subscribers(key, {'type': 'oi', **instrument, 'oi': packet.oi}, replaceable=False)
+        
+        elif code == DISCONNECT:
+            logger.error(f"[DhanHQ] Feed disconnect notice, reason code {packet.reason}")
+            await self.broadcast_to_clients({'type': 'status', 'message': {'disconnect_code': packet.reason}})
+        
+        elif code == MARKET_STATUS:
+            await self.broadcast_to_clients({'type': 'status', 'message': 'Market status update'})
     
     async def process_text_message(self, message: str):
         """Process text messages from DhanHQ (status, errors, etc.)"""
@@ -165,45 +271,164 @@ class DhanHQWebSocketManager:
         if not self.clients:
             return
         
-        # Convert to JSON
+        # Encode once; each client's writer task does the actual send
         message_json = json.dumps(message)
+        for session in self.clients.values():
+            session.enqueue(message_json)
+    
+    async def send_to_subscribers(self, key: InstrumentKey, message: dict, record: Optional[list] = None,
+                                  replaceable: bool = True):
+        """Queue a tick for the clients subscribed to its instrument
+
+        Each format is encoded at most once per tick, on first need, and
+        the resulting object is shared by every recipient. `record` holds
+        the encode_tick arguments for clients on the binary format.
+        Messages that are not `replaceable` are queued without the
+        instrument key, so conflation and rate caps never let a later tick
+        overwrite them.
+        """
+        subscribers = self.subscriptions.get(key)
+        if not subscribers:
+            return
         
-        # Send to all clients
-        disconnected_clients = set()
-        for client in self.clients:
-            try:
-                await client.send(message_json)
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_clients.add(client)
-            except Exception as e:
-                logger.error(f"[Broadcast] Error sending to client: {e}")
-                disconnected_clients.add(client)
-        
-        # Remove disconnected clients
-        for client in disconnected_clients:
-            await self.remove_client(client)
+        queue_key = key if replaceable else None
+        message_json = None
+        message_binary = None
+        for client in subscribers:
+            session = self.clients.get(client)
+            if not session:
+                continue
+            if session.binary and record is not None:
+                if message_binary is None:
+                    message_binary = encode_tick(*record)
+                session.enqueue(message_binary, queue_key)
+            else:
+                if message_json is None:
+                    message_json = json.dumps(message, separators=(',', ':'))
+                session.enqueue(message_json, queue_key)
+    
+    def set_client_rate(self, websocket: websockets.WebSocketServerProtocol, max_rate) -> bool:
+        """Cap a client's updates per instrument per second; intermediate ticks are conflated"""
+        session = self.clients.get(websocket)
+        if not session:
+            return False
+        try:
+            max_rate = float(max_rate) if max_rate else None
+        except (TypeError, ValueError):
+            return False
+        if max_rate is not None and max_rate <= 0:
+            return False
+        session.set_max_rate(max_rate)
+        self.send_to_client(websocket, {'type': 'rate', 'max_rate': max_rate})
+        return True
+    
+    def set_client_batching(self, websocket: websockets.WebSocketServerProtocol, batch_ms) -> bool:
+        """Gather a client's ticks for `batch_ms` and send them as multi-update frames; 0 turns it off"""
+        session = self.clients.get(websocket)
+        if not session:
+            return False
+        try:
+            batch_ms = float(batch_ms or 0)
+        except (TypeError, ValueError):
+            return False
+        if not 0 <= batch_ms <= MAX_BATCH_MS:
+            return False
+        session.set_batch_window(batch_ms / 1000)
+        self.send_to_client(websocket, {'type': 'batching', 'batch_ms': batch_ms,
+                                        'max_frame_bytes': self.max_frame_bytes})
+        return True
+    
+    def set_client_format(self, websocket: websockets.WebSocketServerProtocol, message_format: str) -> bool:
+        """Switch a client between JSON tickers and compact binary tick records"""
+        session = self.clients.get(websocket)
+        if not session or message_format not in FORMATS:
+            return False
+        session.binary = message_format == 'binary'
+        self.send_to_client(websocket, {
+            'type': 'format',
+            'format': message_format,
+            'record_size': TICK_RECORD.size if session.binary else None
+        })
+        return True
+    
+    def send_to_client(self, websocket: websockets.WebSocketServerProtocol, message: dict):
+        """Queue a message for one client behind anything already pending"""
+        session = self.clients.get(websocket)
+        if session:
+            session.enqueue(json.dumps(message))
     
     async def add_client(self, websocket: websockets.WebSocketServerProtocol):
         """Add a new client connection"""
-        self.clients.add(websocket)
+        session = ClientSession(websocket, self.client_queue_size, self.slow_client_policy,
+                                self.max_frame_bytes)
+        session.set_max_rate(self.default_max_rate)
+        session.set_batch_window(self.default_batch_ms / 1000)
+        self.clients[websocket] = session
+        session.start()
         logger.info(f"[Clients] New client connected. Total: {len(self.clients)}")
         
         # Send connection status
-        await websocket.send(json.dumps({
+        self.send_to_client(websocket, {
             'type': 'status',
             'message': 'Connected to price feed'
-        }))
+        })
     
     async def remove_client(self, websocket: websockets.WebSocketServerProtocol):
         """Remove a client connection"""
-        self.clients.discard(websocket)
+        session = self.clients.pop(websocket, None)
+        if session is None:
+            return
+        session.stop()
+        closed = session.stats()
+        for counter in ('sent', 'frames', 'dropped', 'conflated', 'rate_limited'):
+            self.closed_totals[counter] += closed[counter]
+        if session.disconnect_reason == 'slow consumer':
+            self.closed_totals['slow_disconnects'] += 1
         logger.info(f"[Clients] Client disconnected. Total: {len(self.clients)}")
         
         # Clean up client's subscriptions
-        for instrument_key in list(self.subscriptions.keys()):
-            self.subscriptions[instrument_key].discard(websocket)
-            if not self.subscriptions[instrument_key]:
-                del self.subscriptions[instrument_key]
+        await self.release_instruments(websocket, self.client_subscriptions.pop(websocket, set()))
+    
+    async def release_instruments(self, websocket: websockets.WebSocketServerProtocol, keys):
+        """Drop the client's interest in `keys`; instruments left with no subscribers go upstream"""
+        orphaned = []
+        for key in keys:
+            subscribers = self.subscriptions.get(key)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.subscriptions[key]
+                    orphaned.append(key)
+        if orphaned:
+            await self.unsubscribe_from_instruments(sorted(orphaned))
+    
+    async def handle_client_unsubscription(self, websocket: websockets.WebSocketServerProtocol, instruments: List[Dict]):
+        """Handle unsubscribe request from a client"""
+        try:
+            client_keys = self.client_subscriptions.get(websocket, set())
+            keys = set()
+            for inst in instruments:
+                try:
+                    key = instrument_key(inst['exchangeSegment'], inst['securityId'])
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"[Client] Skipping invalid instrument {inst}: {e}")
+                    continue
+                if key in client_keys:
+                    keys.add(key)
+            client_keys.difference_update(keys)
+            session = self.clients.get(websocket)
+            if session:
+                for key in keys:
+                    session.forget(key)
+            await self.release_instruments(websocket, keys)
+            
+            self.send_to_client(websocket, {
+                'type': 'unsubscribed',
+                'count': len(keys)
+            })
+            
+        except Exception as e:
+            logger.error(f"[Client] Unsubscription error: {e}")
     
     async def handle_client_subscription(self, websocket: websockets.WebSocketServerProtocol, instruments: List[Dict]):
         """Handle subscription request from a client"""
@@ -211,79 +436,88 @@ class DhanHQWebSocketManager:
             logger.info(f"[Client] Subscription request for {len(instruments)} instruments")
             
             # Track which instruments this client wants
+            keys = set()
             for inst in instruments:
-                key = f"{inst['exchangeSegment']}:{inst['securityId']}"
-                if key not in self.subscriptions:
-                    self.subscriptions[key] = set()
-                self.subscriptions[key].add(websocket)
-            
-            # Check if we need to subscribe to new instruments on DhanHQ
-            new_instruments = []
-            for inst in instruments:
-                dhan_key = (inst['exchangeSegment'], str(inst['securityId']))
-                if dhan_key not in self.subscribed_instruments:
-                    new_instruments.append({
-                        'ExchangeSegment': inst['exchangeSegment'],
-                        'SecurityId': int(inst['securityId'])
-                    })
+                try:
+                    keys.add(instrument_key(inst['exchangeSegment'], inst['securityId']))
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"[Client] Skipping invalid instrument {inst}: {e}")
+            client_keys = self.client_subscriptions.setdefault(websocket, set())
+            for key in keys:
+                self.subscriptions.setdefault(key, set()).add(websocket)
+                client_keys.add(key)
             
-            # Subscribe to new instruments on DhanHQ
+            # Each instrument's subscriber set is its reference count; only
+            # instruments nobody was following yet go upstream
+            new_instruments = sorted(key for key in keys if key not in self.subscribed_instruments)
             if new_instruments:
                 logger.info(f"[DhanHQ] Subscribing to {len(new_instruments)} new instruments")
                 await self.subscribe_to_instruments(new_instruments)
             
             # Send confirmation to client
-            await websocket.send(json.dumps({
+            self.send_to_client(websocket, {
                 'type': 'subscribed',
-                'count': len(instruments)
-            }))
+                'count': len(keys)
+            })
             
         except Exception as e:
             logger.error(f"[Client] Subscription error: {e}")
     
-    async def reconnect_to_dhan(self):
-        """Attempt to reconnect to DhanHQ"""
-        if self.reconnect_attempts >= self.max_reconnect_attempts:
-            logger.error("[DhanHQ] Max reconnection attempts reached")
-            return
-        
-        self.reconnect_attempts += 1
-        wait_time = min(5 * self.reconnect_attempts, 60)
-        
-        logger.info(f"[DhanHQ] Reconnecting in {wait_time}s (attempt {self.reconnect_attempts})")
-        await asyncio.sleep(wait_time)
-        
-        if await self.connect_to_dhan():
-            # Resubscribe to all instruments
-            if self.subscribed_instruments:
-                instruments = [
-                    {'ExchangeSegment': seg, 'SecurityId': int(sid)}
-                    for seg, sid in self.subscribed_instruments
-                ]
-                await self.subscribe_to_instruments(instruments)
-            
-            # Resume message handling
-            asyncio.create_task(self.handle_dhan_messages())
+    async def publish_heartbeat(self):
+        """Tell last-value readers the feed is live; they fall back upstream otherwise"""
+        while self.running:
+            if self.feed_connected:
+                self.last_values.heartbeat()
+            await asyncio.sleep(1)
+    
+    def stats(self) -> dict:
+        """Queue depth across connected clients; send and drop counters since start"""
+        sessions = [session.stats() for session in self.clients.values()]
+        totals = {'clients': len(sessions), 'queue_depth': 0, 'max_queue_depth': 0}
+        totals.update(self.closed_totals)
+        for stats in sessions:
+            totals['queue_depth'] += stats['queue_depth']
+            totals['max_queue_depth'] = max(totals['max_queue_depth'], stats['max_depth'])
+            for counter in ('sent', 'frames', 'dropped', 'conflated', 'rate_limited'):
+                totals[counter] += stats[counter]
+        totals.update({
+            'slow_client_policy': self.slow_client_policy,
+            'client_queue_size': self.client_queue_size,
+            'subscribed_instruments': len(self.subscribed_instruments),
+            'frame_queue_depth': self.frames.qsize(),
+            'feed_connections': [conn.stats() for conn in self.connections]
+        })
+        if self.ingest:
+            totals.update(self.ingest.stats())
+        return totals
     
     async def start(self):
         """Start the WebSocket manager"""
         self.running = True
+        if self.last_values:
+            self.heartbeat_task = asyncio.create_task(self.publish_heartbeat())
         
-        # Connect to DhanHQ
-        if await self.connect_to_dhan():
-            # Start message handler
-            asyncio.create_task(self.handle_dhan_messages())
-            logger.info("[Manager] WebSocket manager started")
-        else:
-            logger.error("[Manager] Failed to start - DhanHQ connection failed")
+        # Connect to DhanHQ; each connection reconnects on its own
+        self.dispatch_task = asyncio.create_task(self.dispatch_frames())
+        for conn in self.connections:
+            conn.start()
+        if self.ingest:
+            self.ingest.start()
+        logger.info(f"[Manager] WebSocket manager started with {len(self.connections)} feed connections")
     
     async def stop(self):
         """Stop the WebSocket manager"""
         self.running = False
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        if self.dispatch_task:
+            self.dispatch_task.cancel()
         
-        # Close DhanHQ connection
-        if self.dhan_ws:
-            await self.dhan_ws.close()
+        # Close DhanHQ connections
+        for conn in self.connections:
+            await conn.close()
+        if self.ingest:
+            await self.ingest.close()
         
         # Close all client connections
         for client in list(self.clients):
@@ -4,11 +4,14 @@ Runs alongside Flask server to handle WebSocket connections
 """
 
 import asyncio
+import multiprocessing
 import websockets
 import json
 import sqlite3
 import logging
+from fanout import IngestPublisher, DEFAULT_SOCKET_PATH
 from websocket_manager import DhanHQWebSocketManager
+from last_value_table import LastValueTable
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,6 +19,30 @@ logger = logging.getLogger(__name__)
 # Global WebSocket manager instance
 ws_manager = None
 
+# Outbound queue per client and what happens when it fills up:
+# 'drop_oldest', 'conflate' (latest price per instrument) or 'disconnect'
+CLIENT_QUEUE_SIZE = 1000
+SLOW_CLIENT_POLICY = 'conflate'
+
+# Per-instrument update cap for clients that don't ask for one (None = every tick);
+# clients set their own with "max_rate" on subscribe
+CLIENT_MAX_RATE = None
+
+# Micro-batching: ticks gathered for this many ms go out as one frame (0 = off);
+# clients choose their own window with "batch_ms" on subscribe
+CLIENT_BATCH_MS = 0
+MAX_FRAME_BYTES = 64 * 1024
+
+# Upstream DhanHQ sockets to spread subscriptions over; DhanHQ allows up to
+# 5 per account at 5000 instruments each
+FEED_CONNECTIONS = 2
+
+# Client fan-out processes sharing port 8765 through SO_REUSEPORT (0 = one
+# process does everything). With workers, this process only ingests the feed
+# and publishes raw frames to them over a Unix socket
+FANOUT_WORKERS = 0
+INGEST_SOCKET = DEFAULT_SOCKET_PATH
+
 def get_dhan_credentials():
     """Fetch DhanHQ credentials from database"""
     try:
@@ -57,12 +84,32 @@ async def handle_client(websocket):
                 
                 # Handle subscription request
                 if data.get('type') == 'subscribe':
+                    if data.get('format'):
+                        ws_manager.set_client_format(websocket, data['format'])
+                    if 'max_rate' in data:
+                        ws_manager.set_client_rate(websocket, data['max_rate'])
+                    if 'batch_ms' in data:
+                        ws_manager.set_client_batching(websocket, data['batch_ms'])
                     instruments = data.get('instruments', [])
                     await ws_manager.handle_client_subscription(websocket, instruments)
                 
+                # Handle unsubscribe request
+                elif data.get('type') == 'unsubscribe':
+                    instruments = data.get('instruments', [])
+                    await ws_manager.handle_client_unsubscription(websocket, instruments)
+                
+                # Opt in to compact binary tick frames, or back to JSON
+                elif data.get('type') == 'format':
+                    if not ws_manager.set_client_format(websocket, data.get('format')):
+                        ws_manager.send_to_client(websocket, {'type': 'error', 'message': 'Unknown format'})
+                
                 # Handle ping
                 elif data.get('type') == 'ping':
-                    await websocket.send(json.dumps({'type': 'pong'}))
+                    ws_manager.send_to_client(websocket, {'type': 'pong'})
+                
+                # Fan-out queue depth and drop counters
+                elif data.get('type') == 'stats':
+                    ws_manager.send_to_client(websocket, {'type': 'stats', 'stats': ws_manager.stats()})
                 
             except json.JSONDecodeError:
                 logger.warning(f"[Client] Invalid JSON: {message}")
@@ -86,41 +133,124 @@ async def initialize_manager():
         logger.error("[Init] Cannot start - missing DhanHQ credentials")
         logger.info("[Init] Please configure credentials in settings")
         # Create manager anyway to accept client connections
-        ws_manager = DhanHQWebSocketManager("", "")
+        ws_manager = DhanHQWebSocketManager("", "", client_queue_size=CLIENT_QUEUE_SIZE,
+                                            slow_client_policy=SLOW_CLIENT_POLICY,
+                                            default_max_rate=CLIENT_MAX_RATE,
+                                            default_batch_ms=CLIENT_BATCH_MS,
+                                            max_frame_bytes=MAX_FRAME_BYTES)
         return
     
-    # Create WebSocket manager
-    ws_manager = DhanHQWebSocketManager(access_token, client_id)
+    # Create WebSocket manager; every tick is also published to the shared
+    # last-value table the Flask /api/market/ltp endpoint reads
+    ws_manager = DhanHQWebSocketManager(access_token, client_id, last_values=LastValueTable(),
+                                        client_queue_size=CLIENT_QUEUE_SIZE,
+                                        slow_client_policy=SLOW_CLIENT_POLICY,
+                                        default_max_rate=CLIENT_MAX_RATE,
+                                        default_batch_ms=CLIENT_BATCH_MS,
+                                        max_frame_bytes=MAX_FRAME_BYTES,
+                                        feed_connections=FEED_CONNECTIONS)
     
     # Start manager
     await ws_manager.start()
     
     logger.info("[Init] WebSocket manager initialized")
 
-async def main():
-    """Main entry point"""
+async def initialize_ingest():
+    """Own the DhanHQ feed and publish it to the fan-out workers"""
     global ws_manager
     
-    # Initialize manager
-    await initialize_manager()
+    access_token, client_id = get_dhan_credentials()
     
-    # Start WebSocket server
+    if not access_token or not client_id:
+        logger.error("[Init] Cannot start feed - missing DhanHQ credentials")
+        logger.info("[Init] Please configure credentials in settings")
+    
+    # Subscriptions come from the workers, reference counted per worker
+    ws_manager = DhanHQWebSocketManager(access_token or "", client_id or "",
+                                        last_values=LastValueTable() if access_token and client_id else None,
+                                        feed_connections=FEED_CONNECTIONS)
+    publisher = IngestPublisher(ws_manager.subscribe_to_instruments, ws_manager.unsubscribe_from_instruments,
+                                INGEST_SOCKET)
+    ws_manager.frame_listeners.append(publisher.publish)
+    await publisher.start()
+    
+    if access_token and client_id:
+        await ws_manager.start()
+    
+    logger.info(f"[Init] Feed ingest publishing to {FANOUT_WORKERS} workers")
+    return publisher
+
+async def serve_clients(reuse_port: bool = False):
+    """Accept price clients on port 8765"""
     server = await websockets.serve(
         handle_client,
         "0.0.0.0",
         8765,
         ping_interval=20,
-        ping_timeout=60
+        ping_timeout=60,
+        reuse_port=reuse_port
     )
     
     logger.info("[Server] WebSocket server started on ws://0.0.0.0:8765")
+    return server
+
+async def worker_main(index: int):
+    """Fan-out worker: clients of its own, ticks from the ingest process"""
+    global ws_manager
+    
+    ws_manager = DhanHQWebSocketManager("", "", client_queue_size=CLIENT_QUEUE_SIZE,
+                                        slow_client_policy=SLOW_CLIENT_POLICY,
+                                        default_max_rate=CLIENT_MAX_RATE,
+                                        default_batch_ms=CLIENT_BATCH_MS,
+                                        max_frame_bytes=MAX_FRAME_BYTES,
+                                        feed_connections=0,
+                                        ingest_path=INGEST_SOCKET)
+    await ws_manager.start()
+    
+    # The kernel spreads new connections over every worker listening here
+    await serve_clients(reuse_port=True)
+    logger.info(f"[Server] Fan-out worker {index} ready")
+    
+    await asyncio.Future()  # Run forever
+
+def run_worker(index: int):
+    try:
+        asyncio.run(worker_main(index))
+    except KeyboardInterrupt:
+        pass
+
+def start_workers():
+    """Fork the fan-out workers before this process starts its event loop"""
+    workers = []
+    for index in range(FANOUT_WORKERS):
+        worker = multiprocessing.Process(target=run_worker, args=(index,), name=f'fanout-{index}', daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+async def main():
+    """Main entry point"""
+    global ws_manager
+    
+    if FANOUT_WORKERS:
+        # Workers accept the clients; this process only feeds them
+        await initialize_ingest()
+    else:
+        # Initialize manager
+        await initialize_manager()
+        
+        # Start WebSocket server
+        await serve_clients()
     
     # Keep server running
     await asyncio.Future()  # Run forever
 
 if __name__ == "__main__":
+    workers = start_workers()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("[Server] Shutting down...")
+        for worker in workers:
+            worker.join(timeout=5)
 
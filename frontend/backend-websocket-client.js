@@ -4,8 +4,19 @@
  * Backend manages DhanHQ connection and distributes prices to all clients
  */
 
+// Compact binary tick records (see backend/client_protocol.py), little-endian:
+// u8 type, u8 segment, u32 securityId, f32 ltp, u32 ltt, f32 change, f32 changePercent
+const TICK_RECORD_SIZE = 22;
+const EXCHANGE_SEGMENT_NAMES = {
+    0: 'IDX_I', 1: 'NSE_EQ', 2: 'NSE_FNO', 3: 'NSE_CURRENCY',
+    4: 'BSE_EQ', 5: 'MCX_COMM', 7: 'BSE_CURRENCY', 8: 'BSE_FNO'
+};
+
 class BackendWebSocketClient {
-    constructor() {
+    constructor(options = {}) {
+        this.binary = !!options.binary; // opt in to binary tick frames
+        this.maxRate = options.maxRate || null; // max updates per instrument per second
+        this.batchMs = options.batchMs || 0; // gather ticks into multi-update frames
         this.ws = null;
         this.connected = false;
         this.subscribed = false;
@@ -34,6 +45,7 @@ class BackendWebSocketClient {
         
         try {
             this.ws = new WebSocket(this.wsUrl);
+            this.ws.binaryType = 'arraybuffer';
             
             this.ws.onopen = () => {
                 console.log('[BackendWS] Connected to backend');
@@ -41,9 +53,16 @@ class BackendWebSocketClient {
                 this.reconnectAttempts = 0;
                 this.updateStatus('Connected');
                 this.startHeartbeat();
+                if (this.binary) {
+                    this.send({ type: 'format', format: 'binary' });
+                }
             };
             
             this.ws.onmessage = (event) => {
+                if (event.data instanceof ArrayBuffer) {
+                    this.handleBinary(event.data);
+                    return;
+                }
                 try {
                     const data = JSON.parse(event.data);
                     this.handleMessage(data);
@@ -74,6 +93,10 @@ class BackendWebSocketClient {
     }
     
     handleMessage(data) {
+        if (data.type === 'batch') {
+            data.updates.forEach(update => this.handleMessage(update));
+            return;
+        }
         console.log('[BackendWS] Message:', data);
         
         switch (data.type) {
@@ -103,11 +126,46 @@ class BackendWebSocketClient {
                 // Heartbeat response
                 break;
                 
+            case 'format':
+                console.log(`[BackendWS] Tick format: ${data.format}`);
+                break;
+                
+            case 'unsubscribed':
+                console.log(`[BackendWS] Unsubscribed from ${data.count} instruments`);
+                break;
+                
+            case 'batching':
+                console.log(`[BackendWS] Batch window: ${data.batch_ms}ms`);
+                break;
+                
+            case 'rate':
+                console.log(`[BackendWS] Max updates per instrument: ${data.max_rate || 'unlimited'}/s`);
+                break;
+                
             default:
                 console.warn('[BackendWS] Unknown message type:', data.type);
         }
     }
     
+    handleBinary(buffer) {
+        if (!this.onTicker) return;
+        const view = new DataView(buffer);
+        for (let offset = 0; offset + TICK_RECORD_SIZE <= buffer.byteLength; offset += TICK_RECORD_SIZE) {
+            if (view.getUint8(offset) !== 1) continue;
+            const segment = view.getUint8(offset + 1);
+            const change = view.getFloat32(offset + 14, true);
+            const changePercent = view.getFloat32(offset + 18, true);
+            this.onTicker({
+                securityId: String(view.getUint32(offset + 2, true)),
+                ltp: Math.round(view.getFloat32(offset + 6, true) * 100) / 100,
+                ltt: view.getUint32(offset + 10, true),
+                exchangeSegment: EXCHANGE_SEGMENT_NAMES[segment] || segment,
+                change: Number.isNaN(change) ? undefined : Math.round(change * 100) / 100,
+                changePercent: Number.isNaN(changePercent) ? undefined : Math.round(changePercent * 100) / 100
+            });
+        }
+    }
+    
     subscribe(instruments) {
         if (!this.connected) {
             console.error('[BackendWS] Not connected, cannot subscribe');
@@ -120,11 +178,30 @@ class BackendWebSocketClient {
             type: 'subscribe',
             instruments: instruments
         };
+        if (this.maxRate) {
+            message.max_rate = this.maxRate;
+        }
+        if (this.batchMs) {
+            message.batch_ms = this.batchMs;
+        }
         
         this.send(message);
         return true;
     }
     
+    unsubscribe(instruments) {
+        if (!this.connected) {
+            return false;
+        }
+        
+        console.log(`[BackendWS] Unsubscribing from ${instruments.length} instruments`);
+        this.send({
+            type: 'unsubscribe',
+            instruments: instruments
+        });
+        return true;
+    }
+    
     send(data) {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
             this.ws.send(JSON.stringify(data));